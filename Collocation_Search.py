@@ -1,19 +1,37 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import ttk, messagebox, scrolledtext, filedialog, simpledialog
 import os
-import pandas as pd
 import threading
 from collections import Counter, defaultdict
-from hazm import Normalizer, word_tokenize, POSTagger
 import traceback
 import pickle
 from pathlib import Path
 import re
-import docx
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import sqlite3
+import heapq
+import math
+import random
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import partial
+from itertools import chain, groupby, islice, product
+# توجه: hazm، pandas و docx سنگین هستند و فقط در اولین استفاده وارد می‌شوند
+# تا پنجره برنامه بدون معطلی نمایش داده شود.
 
 # بخش توابع پردازش متن (text_processing.py)
 def get_text_from_docx(file_path: Path) -> str | None:
     """متن را از یک فایل .docx استخراج می‌کند."""
+    import docx
     try:
         doc = docx.Document(file_path)
         return '\n'.join([para.text for para in doc.paragraphs])
@@ -22,11 +40,15 @@ def get_text_from_docx(file_path: Path) -> str | None:
         return None
 
 
-def load_correction_list(file_path: Path | None) -> dict:
-    """لیست اصلاحات را از یک فایل اکسل بارگذاری می‌کند."""
+def load_correction_list(file_path: Path | None) -> dict | None:
+    """
+    لیست اصلاحات را از یک فایل اکسل بارگذاری می‌کند. اگر فایلی داده نشده باشد {} و اگر فایل خوانده نشود
+    (مثلاً نیمه‌ذخیره یا قفل‌شده توسط اکسل) None برمی‌گرداند تا با «همه مدخل‌ها حذف شده‌اند» اشتباه نشود.
+    """
     if not file_path or not file_path.exists():
         return {}
     try:
+        import pandas as pd
         all_sheets = pd.read_excel(file_path, sheet_name=None, header=None, names=['incorrect', 'correct'],
                                    engine='openpyxl')
         correction_dict = {}
@@ -35,7 +57,7 @@ def load_correction_list(file_path: Path | None) -> dict:
             correction_dict.update(dict(zip(df_sheet['incorrect'].astype(str), df_sheet['correct'].astype(str))))
         return correction_dict
     except Exception:
-        return {}
+        return None
 
 
 def make_corrections_fast(text: str, correction_dict: dict) -> str:
@@ -47,6 +69,29 @@ def make_corrections_fast(text: str, correction_dict: dict) -> str:
     return re.sub(regex, lambda m: correction_dict[m.group(0)], text)
 
 
+def correction_list_info(file_path: Path | None, correction_dict: dict) -> dict:
+    """مشخصات لیست اصلاحاتی که کش با آن ساخته شده است (برای ثبت در سرآیند کش)."""
+    entries = dict(sorted(correction_dict.items()))
+    return {
+        "path": str(file_path) if file_path else None,
+        "fingerprint": file_fingerprint(file_path) if file_path else None,
+        "hash": hashlib.sha1(json.dumps(entries, ensure_ascii=False).encode('utf-8')).hexdigest(),
+        "entries": entries,
+    }
+
+
+def diff_correction_lists(old: dict, new: dict) -> tuple[dict, set[str]]:
+    """
+    (مدخل‌های افزوده یا تغییرکرده، صورت‌های متأثر) را برمی‌گرداند. صورت‌های متأثر صورت نادرست
+    مدخل‌های تازه (که هنوز در متن مانده‌اند) و صورت درست قدیمی مدخل‌های تغییرکرده یا حذف‌شده
+    (که به جای صورت نادرست در متن نشسته‌اند) هستند.
+    """
+    changed = {key: value for key, value in new.items() if old.get(key) != value}
+    forms = set(changed)
+    forms.update(value for key, value in old.items() if new.get(key) != value)
+    return changed, forms
+
+
 def find_best_split_point(text: str, ideal_pos: int, max_words_limit: int) -> int:
     """بهترین نقطه برای تقسیم یک پاراگراف طولانی را پیدا می‌کند."""
     end_chars = {'.', '!', '?', ':', '؟'}
@@ -115,6 +160,1614 @@ def process_paragraphs(paragraphs: list[str], normalizer, max_words: int, ideal_
 
     return final_segments
 
+
+# تشخیص بخش‌های تکراری (چاپ‌های مختلف، فصل‌های کپی‌شده): تکرار عینی با هش متن و تکرار تقریبی
+# با MinHash روی سه‌تایی‌های کلمات و LSH (تقسیم امضا به چند باند) پیدا می‌شود.
+# ۸ باند ۴ ردیفی: آستانه LSH حدود (1/8)^(1/4) ≈ 0.59، پس جفتی با شباهت 0.8 تقریباً همیشه نامزد می‌شود؛
+# شباهت نامزدها سپس دقیقاً روی مجموعه سه‌تایی‌ها سنجیده می‌شود، نه با تخمین امضا
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8
+NEAR_DUPLICATE_THRESHOLD = 0.8
+NEAR_DUPLICATE_MIN_WORDS = 12  # بخش‌های کوتاه‌تر فقط از نظر تکرار عینی بررسی می‌شوند
+_HASH_MASK = (1 << 64) - 1
+
+
+class DuplicateDetector:
+    """
+    بخش‌ها را به ترتیب ورود بررسی می‌کند و برای هر کدام (بخش اصلی تکرار عینی، بخش اصلی تکرار
+    تقریبی) را برمی‌گرداند؛ ‎-1 یعنی تکراری نیست. بخش اصلی همیشه اولین رخداد متن است.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, min_words: int = NEAR_DUPLICATE_MIN_WORDS):
+        rng = random.Random(1)
+        self.permutations = [(rng.getrandbits(64) | 1, rng.getrandbits(64)) for _ in range(MINHASH_PERMUTATIONS)]
+        self.threshold, self.min_words = threshold, min_words
+        self.exact = {}  # هش متن -> بخش اصلی
+        self.buckets = {}  # هش (باند، مقادیر) -> بخش (یا فهرست بخش‌ها در صورت برخورد)
+        self.shingles, self.shingle_rows = array('I'), {}  # هش ۳۲ بیتی سه‌تایی‌های بخش‌های اصلی
+        self.count = 0
+
+    def _signature(self, hashes: set[int]) -> list[int]:
+        return [min(((a * h + b) & _HASH_MASK) >> 32 for h in hashes) for a, b in self.permutations]
+
+    def check(self, text: str) -> tuple[int, int]:
+        seg = self.count
+        self.count += 1
+        words = text.split()
+        digest = hashlib.blake2b(" ".join(words).encode('utf-8'), digest_size=16).digest()
+        original = self.exact.get(digest)
+        if original is not None:
+            return original, -1
+        self.exact[digest] = seg
+        if len(words) < self.min_words:
+            return -1, -1
+
+        hashes = {hash(shingle) & 0xFFFFFFFF for shingle in zip(words, words[1:], words[2:])}
+        signature = self._signature(hashes)
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        band_keys = [hash((band, tuple(signature[band * rows:(band + 1) * rows]))) for band in range(LSH_BANDS)]
+        candidates = set()
+        for key in band_keys:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                candidates.update(bucket if isinstance(bucket, list) else (bucket,))
+        for candidate in sorted(candidates):
+            start, end = self.shingle_rows[candidate]
+            other = set(self.shingles[start:end])
+            if len(hashes & other) >= self.threshold * len(hashes | other):
+                return -1, candidate
+
+        # فقط بخش‌های اصلی در LSH ثبت می‌شوند تا زنجیره‌ای از تکرارهای تقریبی ساخته نشود
+        for key in band_keys:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = seg
+            elif isinstance(bucket, list):
+                bucket.append(seg)
+            else:
+                self.buckets[key] = [bucket, seg]
+        self.shingle_rows[seg] = len(self.shingles), len(self.shingles) + len(hashes)
+        self.shingles.extend(hashes)
+        return -1, -1
+
+
+TAG_CACHE_MAX_BYTES = 512 * 1024 * 1024
+TAG_CACHE_COMMIT_EVERY = 1000
+
+
+class TagCache:
+    """
+    کش پایدار برچسب‌گذاری در یک فایل SQLite: هش (نسخه مدل + متن نرمال‌شده بخش) -> توکن‌ها و نقش‌ها.
+    بخشی که یک بار (در هر پردازش، کتاب یا تنظیمات تقسیم‌بندی) برچسب خورده است دیگر به مدل داده
+    نمی‌شود. حجم کش به max_bytes محدود است و مدخل‌هایی که دیرتر از همه استفاده شده‌اند (LRU) حذف می‌شوند.
+    """
+
+    def __init__(self, path, model_version: str, max_bytes: int = TAG_CACHE_MAX_BYTES):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS tags (key BLOB PRIMARY KEY, value BLOB NOT NULL, "
+                                "size INTEGER NOT NULL, last_used INTEGER NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tags_last_used ON tags (last_used)")
+        self.model_version, self.max_bytes = model_version, max_bytes
+        # ساعت منطقی LRU: با هر دسترسی یک واحد جلو می‌رود و بین اجراها ادامه پیدا می‌کند
+        self.clock = self.connection.execute("SELECT COALESCE(MAX(last_used), 0) FROM tags").fetchone()[0]
+        self.hits = self.misses = self.pending_writes = 0
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.blake2b(f"{self.model_version}\0{text}".encode('utf-8'), digest_size=16).digest()
+
+    def tag(self, text: str, tag_text) -> list[tuple[str, str]]:
+        """برچسب‌های بخش را از کش برمی‌گرداند و در صورت نبودن، با tag_text(متن) محاسبه و ذخیره می‌کند."""
+        key = self._key(text)
+        self.clock += 1
+        row = self.connection.execute("SELECT value FROM tags WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.hits += 1
+            self.connection.execute("UPDATE tags SET last_used = ? WHERE key = ?", (self.clock, key))
+            value = row[0]
+            tagged = [tuple(line.split('\t')) for line in str(value, 'utf-8').split('\n')] if value else []
+        else:
+            self.misses += 1
+            tagged = tag_text(text)
+            value = '\n'.join(f"{word}\t{tag}" for word, tag in tagged).encode('utf-8')
+            self.connection.execute("INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?)",
+                                    (key, value, len(value) + len(key), self.clock))
+        self.pending_writes += 1
+        if self.pending_writes >= TAG_CACHE_COMMIT_EVERY:
+            self.connection.commit()
+            self.pending_writes = 0
+        return tagged
+
+    def _evict(self):
+        """اگر حجم کش از سقف بیشتر شد، قدیمی‌ترین مدخل‌ها را تا ۹۰٪ سقف حذف می‌کند."""
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM tags").fetchone()[0]
+        excess = total - int(self.max_bytes * 0.9)
+        if total <= self.max_bytes or excess <= 0:
+            return
+        freed, cutoff = 0, None
+        for size, last_used in self.connection.execute("SELECT size, last_used FROM tags ORDER BY last_used"):
+            freed += size
+            cutoff = last_used
+            if freed >= excess:
+                break
+        self.connection.execute("DELETE FROM tags WHERE last_used <= ?", (cutoff,))
+
+    def close(self):
+        self._evict()
+        self.connection.commit()
+        self.connection.close()
+
+# ==============================================================================
+# بخش قالب کش ستونی پیکره
+# فایل کش از یک سرآیند JSON (نسخه قالب، نسخه hazm و مدل، تنظیمات ساخت و چکسام پیکره)
+# و تعدادی بخش (section) باینری تشکیل شده است. هر بخش یک آرایه عددی یا متن است که
+# با array.frombytes (یا به صورت mmap) بدون هزینه pickle خوانده می‌شود.
+CACHE_MAGIC = b'CSCACHE\x00'
+CACHE_FORMAT_VERSION = 2  # نسخه ۱ همان فایل pickle قدیمی است
+
+
+def _get_codec(name: str | None):
+    """توابع فشرده‌سازی/بازگشایی را برای 'zstd' یا 'lz4' برمی‌گرداند (هر دو اختیاری هستند)."""
+    if not name or name == 'none':
+        return None
+    if name == 'zstd':
+        import zstandard
+        return (lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+                lambda data: zstandard.ZstdDecompressor().decompress(data))
+    if name == 'lz4':
+        import lz4.frame
+        return lz4.frame.compress, lz4.frame.decompress
+    raise ValueError(f"Unknown cache compression: {name}")
+
+
+def get_hazm_version() -> str:
+    """نسخه hazm را بدون وارد کردن خود کتابخانه می‌خواند."""
+    try:
+        from importlib.metadata import version
+        return version('hazm')
+    except Exception:
+        return "unknown"
+
+
+def file_fingerprint(path) -> str | None:
+    """اثر انگشت سبک (اندازه و زمان تغییر) یک فایل، مثلاً فایل مدل."""
+    try:
+        st = os.stat(path)
+        return f"{st.st_size}-{int(st.st_mtime)}"
+    except OSError:
+        return None
+
+
+def compute_corpus_checksum(root_folder: Path | None) -> str | None:
+    """چکسام فهرست فایل‌های .docx (مسیر، اندازه و زمان تغییر) برای تشخیص تغییر کتاب‌ها."""
+    if not root_folder or not root_folder.exists():
+        return None
+    digest = hashlib.sha1()
+    for file_path_obj in sorted(root_folder.rglob('*.docx')):
+        st = file_path_obj.stat()
+        digest.update(f"{file_path_obj.relative_to(root_folder).as_posix()}|{st.st_size}|{int(st.st_mtime)}\n"
+                      .encode('utf-8'))
+    return digest.hexdigest()
+
+
+def align_token_offsets(sentence: str, words: list[str]) -> list[tuple[int, int]]:
+    """
+    بازه نویسه‌ای هر توکن را در جمله پیدا می‌کند. بخش‌های فعل که توکن‌ساز hazm با '_' به هم
+    چسبانده است با فاصله یا نیم‌فاصله در متن تطبیق داده می‌شوند. توکنی که پیدا نشود
+    (یا پیدا کردنش مستلزم رد شدن از حروف باشد) بازه‌ای خالی در مکان فعلی می‌گیرد.
+    """
+    spans, cursor = [], 0
+    for word in words:
+        if '_' in word:
+            pattern = '[\\s\u200c_]*'.join(re.escape(part) for part in word.split('_'))
+            found = re.compile(pattern).search(sentence, cursor)
+            start, end = (found.start(), found.end()) if found else (-1, -1)
+        else:
+            start = sentence.find(word, cursor)
+            end = start + len(word)
+        if start < 0 or any(ch.isalnum() for ch in sentence[cursor:start]):
+            start = end = cursor
+        spans.append((start, end))
+        cursor = end
+    return spans
+
+
+def book_sort_key(book_path: str) -> tuple:
+    """کلید مرتب‌سازی کتاب‌ها بر اساس اجزای مسیر، تا هر زیرپوشه بازه‌ای پیوسته از کتاب‌ها باشد."""
+    return tuple(re.split(r'[\\/]', book_path))
+
+
+def build_postings(ids, vocab_size: int) -> tuple[array, array]:
+    """
+    نمایه معکوس فشرده (CSR) می‌سازد: مکان‌های شناسه t در postings[starts[t]:starts[t + 1]]
+    به ترتیب صعودی قرار دارند. ساخت با شمارش (counting sort) و در زمان خطی انجام می‌شود.
+    """
+    counts = [0] * (vocab_size + 1)
+    for token_id in ids:
+        counts[token_id + 1] += 1
+    for i in range(vocab_size):
+        counts[i + 1] += counts[i]
+    starts = array('q', counts)
+    cursor = counts[:-1]
+    postings = array('i', [0]) * len(ids)
+    for position, token_id in enumerate(ids):
+        postings[cursor[token_id]] = position
+        cursor[token_id] += 1
+    return starts, postings
+
+
+# تبدیل تگ‌های مدل به کدهایی که Lemmatizer هازم می‌پذیرد (فعل، صفت، ضمیر)
+HAZM_LEMMA_POS = {"VERB": "V", "ADJ": "AJ", "ADJ,EZ": "AJ", "PRON": "PRO"}
+
+
+class Corpus:
+    """
+    داده‌های برچسب‌خورده پیکره به صورت ستونی.
+    توکن‌ها و نقش‌ها شناسه‌های عددی در آرایه‌های پیوسته هستند و هر بخش (segment)
+    بازه seg_starts[i]:seg_starts[i + 1] از این آرایه‌ها است.
+    """
+    # نام بخش -> typecode آرایه؛ لایه‌های جدید فقط با افزودن به این فهرست ذخیره می‌شوند
+    ARRAY_SECTIONS = {'tokens': 'i', 'pos': 'H', 'seg_starts': 'q', 'seg_books': 'i', 'sent_offsets': 'q',
+                      'word_post_starts': 'q', 'word_postings': 'i',
+                      'token_lemmas': 'i', 'lemma_post_starts': 'q', 'lemma_postings': 'i',
+                      'pos_post_starts': 'q', 'pos_postings': 'i',
+                      'token_starts': 'I', 'token_ends': 'I', 'seg_copy_of': 'i', 'seg_near_of': 'i'}
+    TEXT_SECTIONS = ('words', 'tags', 'books', 'lemmas')  # فهرست رشته‌ها که با '\n' به هم چسبانده می‌شوند
+    BLOB_SECTIONS = ('sent_blob',)
+
+    def __init__(self, root_folder_path: Path | None = None):
+        self.root_folder_path = root_folder_path
+        self.words, self.word_ids = [], {}
+        self.tags, self.tag_ids = [], {}
+        self.books, self.book_ids = [], {}
+        self.tokens, self.pos = array('i'), array('H')
+        self.seg_starts, self.seg_books = array('q', [0]), array('i')
+        self.sent_offsets, self.sent_blob = array('q', [0]), b''
+        self.word_post_starts, self.word_postings = array('q'), array('i')
+        self.pos_post_starts, self.pos_postings = array('q'), array('i')
+        # لایه بن (lemma): شناسه بن هر توکن و نمایه آن، دقیقاً مشابه لایه کلمات
+        self.lemmas, self.lemma_ids = [], {}
+        self.token_lemmas, self.lemma_post_starts, self.lemma_postings = array('i'), array('q'), array('i')
+        # بازه نویسه‌ای هر توکن در جمله خودش (برای هایلایت دقیق و نمایش KWIC)
+        self.token_starts, self.token_ends = array('I'), array('I')
+        # بخش‌های تکراری: seg_copy_of شماره بخش اصلی برای نسخه‌های عیناً تکراری (که فقط به صورت ارجاع و
+        # بدون توکن ذخیره می‌شوند) و seg_near_of شماره بخش اصلی برای تکرارهای تقریبی؛ ‎-1 یعنی تکراری نیست
+        self.seg_copy_of, self.seg_near_of = array('i'), array('i')
+        self.copies = {}  # بخش اصلی -> فهرست مرتب نسخه‌های عیناً تکراری آن (هنگام بارگذاری محاسبه می‌شود)
+        self.copy_segs = array('i')  # همه نسخه‌های عیناً تکراری به ترتیب (برای یافتن نسخه‌های یک بازه)
+        # پوشه/کتاب -> بازه پیوسته بخش‌ها؛ هنگام بارگذاری از روی فهرست مرتب کتاب‌ها محاسبه می‌شود
+        self.facet_ranges = {}
+        self._mmap = None
+
+    @classmethod
+    def from_segments(cls, segments, root_folder_path: Path | None = None) -> 'Corpus':
+        """
+        پیکره را از دنباله‌ای از (جمله، [(کلمه، نقش)...]، مسیر کتاب) می‌سازد. هر مورد می‌تواند دو عضو
+        اضافه (بخش اصلی نسخه عیناً تکراری، بخش اصلی تکرار تقریبی) هم داشته باشد؛ برای نسخه عیناً
+        تکراری جمله و برچسب‌ها نادیده گرفته شده و فقط ارجاع به بخش اصلی ذخیره می‌شود.
+        """
+        corpus = cls(root_folder_path)
+        sent_parts = []
+        for sentence, tagged, book_path, *duplicate_of in segments:
+            corpus._append_segment(sentence, tagged, book_path, sent_parts, *duplicate_of)
+        corpus.sent_blob = b''.join(sent_parts)
+        return corpus
+
+    def _append_segment(self, sentence, tagged, book_path, sent_parts, copy_of: int = -1, near_of: int = -1):
+        self.seg_copy_of.append(copy_of)
+        self.seg_near_of.append(near_of)
+        if copy_of >= 0:
+            sentence, tagged = "", ()
+        for word, tag in tagged:
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                word_id = self.word_ids[word] = len(self.words)
+                self.words.append(word)
+            tag_id = self.tag_ids.get(tag)
+            if tag_id is None:
+                tag_id = self.tag_ids[tag] = len(self.tags)
+                self.tags.append(tag)
+            self.tokens.append(word_id)
+            self.pos.append(tag_id)
+        self.seg_starts.append(len(self.tokens))
+        book_id = self.book_ids.get(book_path)
+        if book_id is None:
+            book_id = self.book_ids[book_path] = len(self.books)
+            self.books.append(book_path)
+        self.seg_books.append(book_id)
+        encoded = sentence.encode('utf-8')
+        sent_parts.append(encoded)
+        self.sent_offsets.append(self.sent_offsets[-1] + len(encoded))
+
+    def __len__(self):
+        return len(self.seg_books)
+
+    def ensure_layers(self, lemmatize=None) -> bool:
+        """
+        لایه‌های مشتق (ترتیب کتاب‌ها، نمایه، بازه‌های پوشه‌ها و در صورت دادن lemmatize، لایه بن)
+        را در صورت نبودن می‌سازد. اگر چیزی ساخته شود True برمی‌گرداند تا کش دوباره ذخیره شود.
+        """
+        changed = False
+        if len(self.seg_copy_of) != len(self):
+            # کش‌های پیش از تشخیص تکرار: هیچ بخشی تکراری علامت نخورده است
+            self.seg_copy_of = array('i', [-1]) * len(self)
+            self.seg_near_of = array('i', [-1]) * len(self)
+            changed = True
+        if not self._is_sorted_by_book():
+            self._sort_by_book()
+            changed = True
+        if len(self.word_post_starts) != len(self.words) + 1:
+            self.word_post_starts, self.word_postings = build_postings(self.tokens, len(self.words))
+            changed = True
+        if len(self.pos_post_starts) != len(self.tags) + 1:
+            self.pos_post_starts, self.pos_postings = build_postings(self.pos, len(self.tags))
+            changed = True
+        if len(self.token_lemmas) != len(self.tokens) and lemmatize is not None:
+            self._build_lemma_layer(lemmatize)
+            changed = True
+        if len(self.token_lemmas) == len(self.tokens) and len(self.lemma_post_starts) != len(self.lemmas) + 1:
+            self.lemma_post_starts, self.lemma_postings = build_postings(self.token_lemmas, len(self.lemmas))
+            changed = True
+        if len(self.token_starts) != len(self.tokens):
+            self._build_offset_layer()
+            changed = True
+        self._build_facet_ranges()
+        self.copies, self.copy_segs = defaultdict(list), array('i')
+        for seg, original in enumerate(self.seg_copy_of):
+            if original >= 0:
+                self.copies[original].append(seg)
+                self.copy_segs.append(seg)
+        return changed
+
+    def _is_sorted_by_book(self) -> bool:
+        keys = [book_sort_key(book) for book in self.books]
+        if keys != sorted(keys):
+            return False
+        seg_books = self.seg_books
+        return all(seg_books[i] <= seg_books[i + 1] for i in range(len(seg_books) - 1))
+
+    def _sort_by_book(self):
+        """بخش‌ها را به ترتیب مسیر کتاب بازچینی می‌کند (برای کش‌هایی که پیش از این ترتیب ساخته شده‌اند)."""
+        order = sorted(range(len(self)), key=lambda seg: (book_sort_key(self.book_path(seg)), seg))
+        new_index = {seg: i for i, seg in enumerate(order)}
+        new_index[-1] = -1
+        # ارجاع‌های تکرار (عینی و تقریبی) به شماره‌های جدید بخش‌ها نگاشته می‌شوند
+        sorted_corpus = Corpus.from_segments(
+            ((self.sentence(seg), self.tagged_segment(seg), self.book_path(seg),
+              new_index[self.seg_copy_of[seg]], new_index[self.seg_near_of[seg]]) for seg in order),
+            self.root_folder_path)
+        self.__dict__.update(sorted_corpus.__dict__)
+
+    def _build_lemma_layer(self, lemmatize):
+        """
+        بن هر توکن را محاسبه می‌کند. lemmatize(کلمه، تگ) فقط یک بار برای هر نوع (کلمه، نقش)
+        صدا زده می‌شود و نتیجه برای بقیه رخدادها از حافظه خوانده می‌شود.
+        """
+        memo, lemmas, lemma_ids = {}, [], {}
+        words, tags, pos_ids, tag_count = self.words, self.tags, self.pos, max(len(self.tags), 1)
+        token_lemmas = array('i', [0]) * len(self.tokens)
+        for i, word_id in enumerate(self.tokens):
+            type_key = word_id * tag_count + pos_ids[i]
+            lemma_id = memo.get(type_key)
+            if lemma_id is None:
+                lemma = lemmatize(words[word_id], tags[pos_ids[i]]) or words[word_id]
+                lemma_id = lemma_ids.get(lemma)
+                if lemma_id is None:
+                    lemma_id = lemma_ids[lemma] = len(lemmas)
+                    lemmas.append(lemma)
+                memo[type_key] = lemma_id
+            token_lemmas[i] = lemma_id
+        self.lemmas, self.lemma_ids, self.token_lemmas = lemmas, lemma_ids, token_lemmas
+        self.lemma_post_starts, self.lemma_postings = array('q'), array('i')
+
+    def _build_offset_layer(self):
+        """مکان نویسه‌ای توکن‌ها را با تطبیق کلمات ذخیره‌شده روی متن جمله هر بخش به دست می‌آورد."""
+        token_starts, token_ends = array('I'), array('I')
+        words, tokens, seg_starts = self.words, self.tokens, self.seg_starts
+        for seg in range(len(self)):
+            segment_words = [words[tokens[i]] for i in range(seg_starts[seg], seg_starts[seg + 1])]
+            for start, end in align_token_offsets(self.sentence(seg), segment_words):
+                token_starts.append(start)
+                token_ends.append(end)
+        self.token_starts, self.token_ends = token_starts, token_ends
+
+    def char_span(self, token_lo: int, token_hi: int) -> tuple[int, int]:
+        """بازه نویسه‌ای توکن‌های token_lo تا token_hi (انحصاری) در جمله بخش آن‌ها."""
+        return self.token_starts[token_lo], self.token_ends[token_hi - 1]
+
+    def kwic(self, seg: int, token_lo: int, token_hi: int, width: int = 60) -> tuple[str, str, str]:
+        """(بافت پیشین، کلیدواژه، بافت پسین) یک رخداد؛ بافت‌ها به width نویسه محدود می‌شوند."""
+        sentence = self.sentence(seg)
+        start, end = self.char_span(token_lo, token_hi)
+        return sentence[max(0, start - width):start].strip(), sentence[start:end], sentence[end:end + width].strip()
+
+    def has_lemmas(self) -> bool:
+        return len(self.token_lemmas) == len(self.tokens) and len(self.lemma_post_starts) == len(self.lemmas) + 1
+
+    def layer(self, name: str) -> tuple:
+        """آرایه شناسه‌ها، واژگان و نمایه لایه 'word'، 'lemma' یا 'pos'."""
+        if name == 'lemma':
+            return self.token_lemmas, self.lemmas, self.lemma_post_starts, self.lemma_postings
+        if name == 'pos':
+            return self.pos, self.tags, self.pos_post_starts, self.pos_postings
+        return self.tokens, self.words, self.word_post_starts, self.word_postings
+
+    def _build_facet_ranges(self):
+        """برای هر پوشه (و هر کتاب) بازه پیوسته بخش‌های آن را ثبت می‌کند."""
+        book_ranges, seg_books = {}, self.seg_books
+        for seg in range(len(self)):
+            book_id = seg_books[seg]
+            if book_id in book_ranges:
+                book_ranges[book_id][1] = seg + 1
+            else:
+                book_ranges[book_id] = [seg, seg + 1]
+        facet_ranges = {}
+        for book_id, (seg_lo, seg_hi) in book_ranges.items():
+            parts = book_sort_key(self.books[book_id])
+            for depth in range(1, len(parts) + 1):
+                facet = "/".join(parts[:depth]) + ("" if depth == len(parts) else "/")
+                if facet in facet_ranges:
+                    lo, hi = facet_ranges[facet]
+                    facet_ranges[facet] = (min(lo, seg_lo), max(hi, seg_hi))
+                else:
+                    facet_ranges[facet] = (seg_lo, seg_hi)
+        self.facet_ranges = facet_ranges
+
+    def facets(self) -> list[str]:
+        """پوشه‌ها (با '/' پایانی) و کتاب‌ها به ترتیب درختی."""
+        return sorted(self.facet_ranges, key=lambda facet: book_sort_key(facet.rstrip("/")))
+
+    def facet_segment_range(self, facet: str | None) -> tuple[int, int] | None:
+        """بازه بخش‌های یک پوشه/کتاب؛ None یعنی این محدوده در مجموعه وجود ندارد."""
+        if not facet:
+            return 0, len(self)
+        return self.facet_ranges.get(facet)
+
+    def segment_of(self, position: int) -> int:
+        return bisect_right(self.seg_starts, position) - 1
+
+    def postings(self, word_id: int, token_lo: int = 0, token_hi: int | None = None, layer: str = 'word'):
+        """مکان‌های یک کلمه (یا بن)، محدود به بازه توکن‌ها با جستجوی دودویی روی خود نمایه."""
+        _, _, post_starts, postings = self.layer(layer)
+        start, end = post_starts[word_id], post_starts[word_id + 1]
+        if token_lo > 0:
+            start = bisect_left(postings, token_lo, start, end)
+        if token_hi is not None:
+            end = bisect_left(postings, token_hi, start, end)
+        return postings[start:end]
+
+    @property
+    def token_count(self) -> int:
+        return len(self.tokens)
+
+    def sentence(self, seg: int) -> str:
+        if self.seg_copy_of[seg] >= 0:
+            seg = self.seg_copy_of[seg]
+        return str(self.sent_blob[self.sent_offsets[seg]:self.sent_offsets[seg + 1]], 'utf-8')
+
+    def book_path(self, seg: int) -> str:
+        return self.books[self.seg_books[seg]]
+
+    def tagged_segment(self, seg: int) -> list[tuple[str, str]]:
+        if self.seg_copy_of[seg] >= 0:
+            seg = self.seg_copy_of[seg]
+        words, tags, tokens, pos = self.words, self.tags, self.tokens, self.pos
+        return [(words[tokens[i]], tags[pos[i]]) for i in range(self.seg_starts[seg], self.seg_starts[seg + 1])]
+
+    def stats(self) -> dict:
+        return {"segments": len(self), "tokens": self.token_count, "types": len(self.words), "books": len(self.books),
+                "duplicates": 2 * len(self) - self.seg_copy_of.tolist().count(-1)
+                              - self.seg_near_of.tolist().count(-1)}
+
+    def segment_tokens(self, seg: int) -> tuple[int, int]:
+        """بازه توکن‌های یک بخش؛ برای نسخه عیناً تکراری، توکن‌های بخش اصلی آن."""
+        if self.seg_copy_of[seg] >= 0:
+            seg = self.seg_copy_of[seg]
+        return self.seg_starts[seg], self.seg_starts[seg + 1]
+
+    def counts_as_unique(self, seg: int, seg_lo: int = 0, seg_hi: int | None = None) -> bool:
+        """
+        در شمارش «فقط یکتا» هر متن یک بار شمرده می‌شود: تکرار تقریبی (یا نسخه آن) وقتی که بخش اصلی‌اش داخل
+        محدوده باشد کنار گذاشته می‌شود و از نسخه‌های عیناً تکراری فقط وقتی که بخش اصلی بیرون از محدوده باشد،
+        اولین نسخه داخل محدوده. بخش seg باید داخل محدوده باشد.
+        """
+        if seg_hi is None:
+            seg_hi = len(self)
+        original = self.seg_copy_of[seg]
+        if seg_lo <= self.seg_near_of[original if original >= 0 else seg] < seg_hi:
+            return False
+        if original < 0:
+            return True
+        if seg_lo <= original < seg_hi:
+            return False
+        copies = self.copies[original]
+        return copies[bisect_left(copies, seg_lo)] == seg
+
+    def segments_with_words(self, words: list[str]) -> set[int]:
+        """بخش‌هایی که همه این کلمات را دارند (به همراه نسخه‌های عیناً تکراری آن‌ها)، از روی نمایه."""
+        word_ids = [self.word_ids.get(word) for word in words]
+        if not word_ids or None in word_ids:
+            return set()
+        post_starts = self.word_post_starts
+        word_ids.sort(key=lambda word_id: post_starts[word_id + 1] - post_starts[word_id])
+        rarest, others = word_ids[0], set(word_ids[1:])
+        tokens, seg_starts, found = self.tokens, self.seg_starts, set()
+        for position in self.postings(rarest):
+            seg = self.segment_of(position)
+            if seg not in found and others.issubset(tokens[seg_starts[seg]:seg_starts[seg + 1]]):
+                found.add(seg)
+                found.update(self.copies.get(seg, ()))
+        return found
+
+    # --- ذخیره و بازیابی ---
+    def _sections(self) -> dict:
+        sections = {name: (typecode, getattr(self, name)) for name, typecode in self.ARRAY_SECTIONS.items()}
+        for name in self.TEXT_SECTIONS:
+            sections[name] = ('text', '\n'.join(getattr(self, name)).encode('utf-8'))
+        for name in self.BLOB_SECTIONS:
+            sections[name] = ('blob', getattr(self, name))
+        return sections
+
+    def _restore_sections(self, sections: dict):
+        for name, value in sections.items():
+            if name in self.TEXT_SECTIONS:
+                items = str(value, 'utf-8').split('\n') if len(value) else []
+                setattr(self, name, items)
+            else:
+                setattr(self, name, value)
+        self.word_ids = {word: i for i, word in enumerate(self.words)}
+        self.lemma_ids = {lemma: i for i, lemma in enumerate(self.lemmas)}
+        self.tag_ids = {tag: i for i, tag in enumerate(self.tags)}
+        self.book_ids = {book: i for i, book in enumerate(self.books)}
+
+
+def write_sections_file(path, header: dict, sections: dict, compression: str | None = None):
+    """
+    سرآیند و بخش‌های باینری را در قالب کش ستونی می‌نویسد (ابتدا در فایل موقت و سپس جایگزینی اتمی).
+    sections: نام -> (نوع، آرایه یا bytes). کلیدهای قالب در سرآیند همیشه از وضعیت فعلی پر می‌شوند.
+    """
+    codec = None
+    if compression:
+        try:
+            codec = _get_codec(compression)
+        except ImportError:
+            compression = None  # کتابخانه فشرده‌سازی نصب نیست؛ بدون فشرده‌سازی ذخیره می‌شود
+    sections_meta, payloads, offset = {}, [], 0
+    for name, (kind, buffer) in sections.items():
+        raw = buffer.tobytes() if isinstance(buffer, array) else bytes(buffer)
+        data = codec[0](raw) if codec else raw
+        padding = (-len(data)) % 8  # هم‌ترازی ۸ بایتی برای خواندن mmap
+        sections_meta[name] = {"kind": kind, "offset": offset, "length": len(data), "raw_length": len(raw)}
+        payloads.append(data + b'\0' * padding)
+        offset += len(data) + padding
+    full_header = {
+        **header,
+        "format_version": CACHE_FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "compression": compression or "none",
+        "sections": sections_meta,
+    }
+    header_bytes = json.dumps(full_header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b' ' * ((-(len(CACHE_MAGIC) + 4 + len(header_bytes))) % 8)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(CACHE_MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        for data in payloads:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+def save_corpus_cache(corpus: Corpus, cache_path, header: dict | None = None, compression: str | None = None):
+    """پیکره را در قالب کش ستونی ذخیره می‌کند."""
+    write_sections_file(cache_path, {
+        **(header or {}),  # اطلاعات زمان ساخت؛ کلیدهای زیر همیشه از وضعیت فعلی پر می‌شوند
+        "root_folder_path": str(corpus.root_folder_path) if corpus.root_folder_path else None,
+        "stats": corpus.stats(),
+    }, corpus._sections(), compression)
+
+
+def read_cache_header(cache_path) -> tuple[dict, int]:
+    """فقط سرآیند کش و محل شروع داده‌ها را می‌خواند (بدون بارگذاری آرایه‌ها)."""
+    with open(cache_path, 'rb') as f:
+        if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+            raise ValueError("Not a columnar corpus cache")
+        (header_len,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    return header, len(CACHE_MAGIC) + 4 + header_len
+
+
+def read_sections_file(path, typecode_of, use_mmap: bool = False) -> tuple[dict, dict, mmap.mmap | None]:
+    """
+    بخش‌های یک فایل کش ستونی را می‌خواند. typecode_of(نام) برای بخش‌های آرایه‌ای typecode و برای
+    بقیه None برمی‌گرداند. اگر use_mmap فعال باشد و فایل فشرده نباشد، آرایه‌ها نمای (memoryview)
+    مستقیم روی فایل هستند و در حافظه کپی نمی‌شوند.
+    """
+    header, data_start = read_cache_header(path)
+    if header.get("format_version") != CACHE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported cache format version: {header.get('format_version')}")
+    codec = _get_codec(header.get("compression"))
+    native = header.get("byteorder", sys.byteorder) == sys.byteorder
+    sections, mm = {}, None
+    with open(path, 'rb') as f:
+        if use_mmap and codec is None and native:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mm)
+            for name, meta in header["sections"].items():
+                start = data_start + meta["offset"]
+                chunk = view[start:start + meta["length"]]
+                typecode = typecode_of(name)
+                sections[name] = chunk.cast(typecode) if typecode else chunk
+        else:
+            for name, meta in header["sections"].items():
+                f.seek(data_start + meta["offset"])
+                data = f.read(meta["length"])
+                if codec:
+                    data = codec[1](data)
+                typecode = typecode_of(name)
+                if typecode:
+                    values = array(typecode)
+                    values.frombytes(data)
+                    if not native:
+                        values.byteswap()
+                    sections[name] = values
+                else:
+                    sections[name] = data
+    return header, sections, mm
+
+
+def load_corpus_cache(cache_path, use_mmap: bool = False) -> tuple[Corpus, dict]:
+    """کش ستونی پیکره را (در صورت امکان با mmap) بارگذاری می‌کند."""
+    header, sections, mm = read_sections_file(cache_path, Corpus.ARRAY_SECTIONS.get, use_mmap)
+    corpus = Corpus(Path(header["root_folder_path"]) if header.get("root_folder_path") else None)
+    corpus._mmap = mm
+    corpus._restore_sections(sections)
+    return corpus, header
+
+
+def migrate_legacy_cache(pickle_path) -> Corpus:
+    """کش قدیمی pickle (فهرست تاپل‌ها یا (فهرست، مسیر پوشه)) را به پیکره ستونی تبدیل می‌کند."""
+    with open(pickle_path, 'rb') as f:
+        cache_content = pickle.load(f)
+    if isinstance(cache_content, tuple) and len(cache_content) == 2 and isinstance(cache_content[1], Path):
+        tagged_data, root_folder_path = cache_content
+    else:
+        tagged_data, root_folder_path = cache_content, None
+    return Corpus.from_segments(tagged_data, root_folder_path)
+
+
+class CorpusRegistry:
+    """
+    فهرست مجموعه‌های نام‌دار (پیکره‌ها). هر مجموعه پوشه کتاب‌ها و فایل کش مستقل خود را دارد
+    و فهرست در فایل corpora.json کنار برنامه نگه‌داری می‌شود.
+    """
+    DEFAULT_NAME = "پیکره اصلی"
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self.path = os.path.join(base_dir, 'corpora.json')
+        # مجموعه پیش‌فرض همان کش قدیمی کنار برنامه است تا کش‌های موجود از دست نروند
+        self.entries = {self.DEFAULT_NAME: {"cache_file": "preprocessed_data.cache", "root_folder_path": None}}
+        self.active = self.DEFAULT_NAME
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            self.entries.update(saved.get("corpora", {}))
+            if saved.get("active") in self.entries:
+                self.active = saved["active"]
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"active": self.active, "corpora": self.entries}, f, ensure_ascii=False, indent=2)
+
+    def names(self) -> list[str]:
+        return list(self.entries)
+
+    def add(self, name: str, root_folder_path: Path | None = None):
+        if name not in self.entries:
+            safe_name = re.sub(r'[\\/*?:"<>|\s]', "_", name)
+            # نام‌های متفاوت (مثلاً «a b» و «a_b») نباید کش و جدول n-gram یکدیگر را بازنویسی کنند؛
+            # مقایسه بدون حساسیت به حروف بزرگ و کوچک است چون سیستم فایل ویندوز چنین است
+            used = {entry["cache_file"].casefold() for entry in self.entries.values()}
+            cache_file, suffix = f"corpus_{safe_name}.cache", 1
+            while cache_file.casefold() in used:
+                suffix += 1
+                cache_file = f"corpus_{safe_name}_{suffix}.cache"
+            self.entries[name] = {"cache_file": cache_file, "root_folder_path": None}
+        if root_folder_path:
+            self.entries[name]["root_folder_path"] = str(root_folder_path)
+        self.save()
+
+    def cache_path(self, name: str) -> str:
+        return os.path.join(self.base_dir, self.entries[name]["cache_file"])
+
+    def stats(self, name: str) -> dict | None:
+        """آمار مجموعه را فقط از سرآیند کش می‌خواند (بدون بارگذاری داده‌ها)."""
+        try:
+            return read_cache_header(self.cache_path(name))[0].get("stats")
+        except (OSError, ValueError):
+            return None
+
+
+# ==============================================================================
+# بخش موتور جستجو روی نمایه
+# زبان پرسش «کلمات مجاور»: هر جزء عبارت یکی از موارد زیر است
+#   کلمه          صورت دقیق (یا بن، اگر «تطبیق: بن» انتخاب شده باشد)
+#   پیشوند*       هر کلمه‌ای که با این پیشوند شروع شود
+#   {بن}          هر صورتی از این بن (lemma)
+#   [اسم] یا NOUN  هر کلمه با این نقش دستوری (نام‌های pos_map یا تگ‌های مدل)
+#   *             دقیقاً یک کلمه دلخواه
+#   *2 یا *1-3    فاصله: بین ۰ تا ۲ (یا ۱ تا ۳) کلمه دلخواه
+QUERY_TOKEN_RE = re.compile(r'\[[^\]]+\]|\{[^}]+\}|\S+')
+QUERY_GAP_RE = re.compile(r'^\*(?:(\d+)-)?(\d+)$')
+QUERY_TAG_RE = re.compile(r'^[A-Z]+(?:,EZ)?$')
+
+
+def parse_query(query: str, normalizer, tokenize, pos_map: dict) -> list[tuple]:
+    """
+    متن پرسش را به فهرست اجزا تبدیل می‌کند: ('word', توکن)، ('prefix', پیشوند)، ('lemma', بن)،
+    ('pos', مجموعه تگ‌ها)، ('any', None) و ('gap', (کمینه، بیشینه)).
+    کلمات عادی پشت سر هم با همان توکن‌ساز پردازش توکن‌بندی می‌شوند تا با داده‌ها یکسان باشند.
+    """
+    known_tags = {tag for tags in pos_map.values() for tag in tags}
+    parts, literal_run = [], []
+
+    def flush_literals():
+        if literal_run:
+            parts.extend(('word', token) for token in tokenize(normalizer.normalize(" ".join(literal_run))))
+            literal_run.clear()
+
+    for raw in QUERY_TOKEN_RE.findall(query):
+        gap_match = QUERY_GAP_RE.match(raw)
+        if raw.startswith('[') and raw.endswith(']'):
+            name = raw[1:-1].strip()
+            if name not in pos_map and name not in known_tags:
+                raise ValueError(f"نقش دستوری '{name}' شناخته نشد.")
+            flush_literals()
+            parts.append(('pos', frozenset(pos_map.get(name, {name}))))
+        elif QUERY_TAG_RE.match(raw) and any(tag.split(',')[0] == raw for tag in known_tags):
+            flush_literals()
+            parts.append(('pos', frozenset(tag for tag in known_tags if tag == raw or tag.split(',')[0] == raw)))
+        elif raw.startswith('{') and raw.endswith('}'):
+            flush_literals()
+            parts.append(('lemma', normalizer.normalize(raw[1:-1].strip())))
+        elif raw == '*':
+            flush_literals()
+            parts.append(('any', None))
+        elif gap_match:
+            flush_literals()
+            low, high = int(gap_match.group(1) or 0), int(gap_match.group(2))
+            if low > high:
+                raise ValueError(f"بازه فاصله '{raw}' نامعتبر است.")
+            parts.append(('gap', (low, high)))
+        elif raw.endswith('*') and len(raw) > 1:
+            flush_literals()
+            parts.append(('prefix', normalizer.normalize(raw[:-1])))
+        else:
+            literal_run.append(raw)
+    flush_literals()
+    # فاصله در ابتدا یا انتهای الگو معنایی ندارد
+    while parts and parts[0][0] == 'gap':
+        parts.pop(0)
+    while parts and parts[-1][0] == 'gap':
+        parts.pop()
+    return parts
+
+
+def is_literal_query(parts: list[tuple]) -> bool:
+    return all(kind == 'word' for kind, _ in parts)
+
+
+def compile_query(parts: list[tuple], corpus: Corpus, match_layer: str, lemmatize) -> list[tuple] | None:
+    """
+    اجزای پرسش را برای یک مجموعه به شناسه‌ها تبدیل می‌کند: ('slot', لایه، مجموعه شناسه‌ها) یا
+    ('gap', کمینه، بیشینه). اگر جزئی در واژگان این مجموعه وجود نداشته باشد None برمی‌گرداند.
+    """
+    compiled = []
+    for kind, value in parts:
+        if kind == 'gap':
+            compiled.append(('gap', value[0], value[1]))
+            continue
+        if kind == 'any':
+            compiled.append(('slot', 'any', None))
+            continue
+        if (kind == 'word' and match_layer == 'lemma') or kind == 'lemma':
+            lemma_id = corpus.lemma_ids.get(value)
+            if lemma_id is None and lemmatize is not None:
+                lemma_id = corpus.lemma_ids.get(lemmatize(value, ""))
+            layer, ids = 'lemma', {lemma_id} if lemma_id is not None else set()
+        elif kind == 'word':
+            word_id = corpus.word_ids.get(value)
+            layer, ids = 'word', {word_id} if word_id is not None else set()
+        elif kind == 'prefix':
+            layer, ids = 'word', {i for i, word in enumerate(corpus.words) if word.startswith(value)}
+        else:  # pos
+            layer, ids = 'pos', {tag_id for tag, tag_id in corpus.tag_ids.items() if tag in value}
+        if not ids:
+            return None
+        compiled.append(('slot', layer, frozenset(ids)))
+    if not any(element[0] == 'slot' and element[1] != 'any' for element in compiled):
+        return None  # الگوی تماماً دلخواه لنگری برای نمایه ندارد
+    return compiled
+
+
+def _match_side(layers, elements, k, position, bound, step):
+    """اجزای یک سمت لنگر را از position به سمت step (۱+ یا ۱-) تطبیق داده و مکان پایانی را برمی‌گرداند."""
+    if k == len(elements):
+        return position
+    element = elements[k]
+    if element[0] == 'gap':
+        for skip in range(element[1], element[2] + 1):
+            found = _match_side(layers, elements, k + 1, position + step * skip, bound, step)
+            if found is not None:
+                return found
+        return None
+    if (step > 0 and position >= bound) or (step < 0 and position < bound):
+        return None
+    if element[1] != 'any' and layers[element[1]][position] not in element[2]:
+        return None
+    return _match_side(layers, elements, k + 1, position + step, bound, step)
+
+
+def match_query(corpus: Corpus, compiled: list[tuple], token_lo: int = 0, token_hi: int | None = None):
+    """
+    رخدادهای یک پرسش کامپایل‌شده را به صورت (بخش، شروع، پایان) برمی‌گرداند (پایان انحصاری است).
+    کم‌بسامدترین جزء به عنوان لنگر از نمایه خوانده می‌شود، فیلتر محدوده روی همان نمایه اعمال
+    می‌شود و بقیه اجزا فقط در اطراف لنگر روی آرایه‌های شناسه بررسی می‌شوند. با فاصله‌های متغیر یک
+    رخداد ممکن است از چند لنگر پیدا شود؛ در این حالت هر شروع فقط یک بار (به ترتیب شروع) برگردانده می‌شود.
+    """
+    if token_hi is None:
+        token_hi = corpus.token_count
+    layers = {'word': corpus.tokens, 'lemma': corpus.token_lemmas, 'pos': corpus.pos}
+
+    def cost(index):
+        post_starts = corpus.layer(compiled[index][1])[2]
+        return sum(post_starts[i + 1] - post_starts[i] for i in compiled[index][2])
+
+    anchor = min((i for i, element in enumerate(compiled) if element[0] == 'slot' and element[1] != 'any'), key=cost)
+    left, right = compiled[:anchor][::-1], compiled[anchor + 1:]
+    min_left = sum(1 if element[0] == 'slot' else element[1] for element in left)
+    min_right = sum(1 if element[0] == 'slot' else element[1] for element in right)
+    _, layer, ids = compiled[anchor]
+    positions = [corpus.postings(i, token_lo + min_left, token_hi - min_right, layer) for i in ids]
+    positions = positions[0] if len(positions) == 1 else sorted(chain.from_iterable(positions))
+
+    seg_starts, hits = corpus.seg_starts, []
+    for anchor_pos in positions:
+        seg = bisect_right(seg_starts, anchor_pos) - 1
+        seg_lo, seg_hi = max(seg_starts[seg], token_lo), min(seg_starts[seg + 1], token_hi)
+        end = _match_side(layers, right, 0, anchor_pos + 1, seg_hi, 1)
+        if end is None:
+            continue
+        start = _match_side(layers, left, 0, anchor_pos - 1, seg_lo, -1)
+        if start is not None:
+            hits.append((seg, start + 1, end))
+    if any(element[0] == 'gap' and element[1] != element[2] for element in compiled):
+        first_by_start = {}
+        for hit in hits:
+            first_by_start.setdefault(hit[1], hit)
+        hits = sorted(first_by_start.values(), key=lambda hit: hit[1])
+    return hits
+
+def iter_counted_hits(corpus: Corpus, compiled: list[tuple], seg_lo: int = 0, seg_hi: int | None = None,
+                      unique: bool = False, scope: tuple[int, int] | None = None):
+    """
+    رخدادهای پرسش در بازه بخش‌ها را با در نظر گرفتن بخش‌های تکراری برمی‌گرداند: (بخش شمارش، شروع، پایان).
+    در حالت «همه رخدادها» هر رخداد بخش اصلی برای نسخه‌های عیناً تکراری داخل بازه هم تکرار می‌شود
+    (توکن‌ها همان توکن‌های بخش اصلی هستند). در حالت «یکتا» هر متن فقط یک بار شمرده می‌شود؛ اگر بازه تنها
+    یک بلوک از محدوده جستجو (scope) باشد، یکتایی نسبت به کل آن محدوده سنجیده می‌شود.
+    """
+    if seg_hi is None:
+        seg_hi = len(corpus)
+    scope_lo, scope_hi = scope or (seg_lo, seg_hi)
+    seg_starts, copies = corpus.seg_starts, corpus.copies
+
+    def copies_within(original):
+        segs = copies[original]
+        return segs[bisect_left(segs, seg_lo):bisect_left(segs, seg_hi)]
+
+    for seg, start, end in match_query(corpus, compiled, seg_starts[seg_lo], seg_starts[seg_hi]):
+        if unique:
+            if corpus.counts_as_unique(seg, scope_lo, scope_hi):
+                yield seg, start, end
+            continue
+        yield seg, start, end
+        if seg in copies:
+            for copy in copies_within(seg):
+                yield copy, start, end
+    if (seg_lo, seg_hi) == (0, len(corpus)):
+        return
+    # نسخه‌های داخل بازه‌ای که بخش اصلی آن‌ها بیرون از بازه است (مثلاً چاپ دوم یک کتاب)؛ از فهرست مرتب
+    # نسخه‌ها خوانده می‌شوند، نه با پیمایش همه بخش‌های بازه
+    copy_segs, seg_copy_of = corpus.copy_segs, corpus.seg_copy_of
+    outside = sorted({seg_copy_of[copy] for copy in
+                      copy_segs[bisect_left(copy_segs, seg_lo):bisect_left(copy_segs, seg_hi)]
+                      if not seg_lo <= seg_copy_of[copy] < seg_hi})
+    for original in outside:
+        inside = copies_within(original)
+        if unique:
+            inside = [copy for copy in inside if corpus.counts_as_unique(copy, scope_lo, scope_hi)]
+            if not inside:
+                continue
+        for _, start, end in match_query(corpus, compiled, seg_starts[original], seg_starts[original + 1]):
+            for copy in inside:
+                yield copy, start, end
+
+
+APPROX_BLOCK_SEGMENTS = 256
+APPROX_TIME_BUDGET = 3.0  # ثانیه
+APPROX_TOP_K = 50
+APPROX_STABLE_BLOCKS = 8
+APPROX_STABLE_OVERLAP = 0.9  # حداقل هم‌پوشانی دو top-K پیاپی برای «ثابت» شمردن رتبه‌بندی
+APPROX_MIN_HITS = 2000
+
+
+class SearchSampler:
+    """
+    واحدهای جستجو (بلوک‌هایی از بخش‌ها) را به ترتیب تصادفی و بدون جایگذاری برمی‌گرداند و پیش از هر
+    بلوک تازه تصمیم می‌گیرد که ادامه دهد یا نه: با تمام شدن بودجه زمانی، یا وقتی top-K پس از چند بلوک
+    پشت سر هم (و دست‌کم APPROX_MIN_HITS رخداد) تقریباً ثابت بماند؛ جابه‌جایی چند کلمه هم‌بسامد در مرز
+    top-K مانع توقف نمی‌شود. ranking() باید (فهرست کلیدهای top-K، تعداد رخدادهای تاکنون) را برگرداند.
+    fraction سهم بخش‌های پردازش‌شده از کل است.
+    """
+
+    def __init__(self, units, unit_size, ranking, time_budget: float = APPROX_TIME_BUDGET, seed=None):
+        self.units = list(units)
+        random.Random(seed).shuffle(self.units)
+        self.unit_size, self.ranking, self.time_budget = unit_size, ranking, time_budget
+        self.total = sum(unit_size(unit) for unit in self.units)
+        self.sampled = 0
+        self.stop_reason = None
+
+    @property
+    def fraction(self) -> float:
+        return self.sampled / self.total if self.total else 1.0
+
+    def __iter__(self):
+        deadline = time.monotonic() + self.time_budget
+        previous, stable_blocks = set(), 0
+        for index, unit in enumerate(self.units):
+            if index:
+                top, hits = self.ranking()
+                top = set(top)
+                overlap = len(top & previous) / len(top | previous) if top else 0.0
+                stable_blocks = stable_blocks + 1 if overlap >= APPROX_STABLE_OVERLAP else 0
+                previous = top
+                if stable_blocks >= APPROX_STABLE_BLOCKS and hits >= APPROX_MIN_HITS:
+                    self.stop_reason = "stable"
+                    return
+                if time.monotonic() > deadline:
+                    self.stop_reason = "time"
+                    return
+            yield unit
+            self.sampled += self.unit_size(unit)
+
+
+def estimate_count(observed: int, fraction: float) -> tuple[int, int, int]:
+    """
+    (تخمین، کران پایین، کران بالا) فراوانی کل از روی فراوانی نمونه با سهم fraction. بازه اطمینان ۹۵٪ با
+    تقریب نرمال نمونه‌گیری دوجمله‌ای بدون جایگذاری است و کران پایین از فراوانی دیده‌شده کمتر نمی‌شود.
+    """
+    if fraction >= 1:
+        return observed, observed, observed
+    estimate = observed / fraction
+    half_width = 1.96 * math.sqrt(observed * (1 - fraction)) / fraction
+    return round(estimate), max(observed, round(estimate - half_width)), round(estimate + half_width)
+
+
+class CollocationTally:
+    """
+    شمارش‌های جستجوی «کلمات مجاور» روی یک یا چند بازه: تعداد رخدادها، شمارنده‌های قبل/بعد/الگو، فراوانی
+    هر ردیف به تفکیک مجموعه یا گروه، پراکندگی و (اگر keep_refs) ارجاع‌های جملات منبع. شمارش‌های بازه‌های
+    جداگانه (مثلاً هر shard در یک پردازه) با merge روی هم جمع می‌شوند؛ پردازه‌های کارگر ارجاع‌ها را نگه
+    نمی‌دارند و آن‌ها بعداً با CollocationRefs فقط برای ردیف‌های انتخاب‌شده پیدا می‌شوند.
+    """
+
+    def __init__(self, keep_refs: bool = True):
+        self.keep_refs = keep_refs
+        self.hits, self.hit_refs = 0, []
+        self.before, self.after, self.pattern = Counter(), Counter(), Counter()
+        self.key_counts = defaultdict(Counter)  # کلید ردیف -> مجموعه یا گروه -> فراوانی
+        self.dispersion = defaultdict(Counter)  # کلید ردیف -> (مجموعه، کتاب) -> فراوانی
+        self.refs = defaultdict(list)  # کلید ردیف -> [(مجموعه، بخش، شروع، پایان)]
+
+    def merge(self, other: 'CollocationTally'):
+        self.hits += other.hits
+        self.hit_refs.extend(other.hit_refs)
+        self.before.update(other.before)
+        self.after.update(other.after)
+        self.pattern.update(other.pattern)
+        for target, source in ((self.key_counts, other.key_counts), (self.dispersion, other.dispersion)):
+            for key, counts in source.items():
+                target[key].update(counts)
+        for key, refs in other.refs.items():
+            self.refs[key].extend(refs)
+
+
+def passes_filters(word: str, pos: str, options: dict) -> bool:
+    """فیلترهای نقش دستوری و شرط («حاوی»/«شروع با») کلمه هم‌نشین."""
+    if options["pos_tags"] is not None and pos not in options["pos_tags"]:
+        return False
+    condition_type, condition_value = options["condition_type"], options["condition_value"]
+    if condition_type == "حاوی" and condition_value not in word:
+        return False
+    if condition_type == "شروع با" and not word.startswith(condition_value):
+        return False
+    return True
+
+
+def tally_collocations(tally: CollocationTally, corpus_name: str, corpus: Corpus, compiled: list[tuple],
+                       scope: tuple[int, int], block: tuple[int, int], label: str, options: dict):
+    """
+    رخدادهای پرسش در بازه block (بخشی از محدوده scope) و کلمات قبل/بعد آن‌ها را در tally می‌شمارد.
+    options: unique، group_layer، mode، is_pattern، phrase (متن عبارت در ستون نمونه)، direct_key و فیلترها.
+    """
+    tokens, words = corpus.layer(options["group_layer"])[:2]
+    tags, pos_ids = corpus.tags, corpus.pos
+    mode, phrase, direct_key = options["mode"], options["phrase"], options["direct_key"]
+    has_filters = options["pos_tags"] is not None or options["condition_type"] != "فرقی نمی‌کند"
+    keep_refs = tally.keep_refs
+
+    def record(key, seg, ref):
+        tally.key_counts[key][label] += 1
+        tally.dispersion[key][(corpus_name, corpus.book_path(seg))] += 1
+        if keep_refs:
+            tally.refs[key].append(ref)
+
+    for seg, i, end in iter_counted_hits(corpus, compiled, *block, options["unique"], scope):
+        seg_start, seg_end = corpus.segment_tokens(seg)
+        tally.hits += 1
+        tally.key_counts[direct_key][label] += 1
+        tally.dispersion[direct_key][(corpus_name, corpus.book_path(seg))] += 1
+        if keep_refs:
+            tally.hit_refs.append((corpus_name, seg, i, end))
+        if options["is_pattern"]:
+            # هر صورت متفاوتی که با الگو تطبیق یافته، یک ردیف جداگانه است
+            matched_text = " ".join(words[tokens[j]] for j in range(i, end))
+            tally.pattern[matched_text] += 1
+            record(("الگو", matched_text), seg, (corpus_name, seg, i, end))
+        if mode in ["هر دو", "کلمه قبلی"] and i > seg_start:
+            prev_word, prev_pos = words[tokens[i - 1]], tags[pos_ids[i - 1]]
+            if not has_filters or passes_filters(prev_word, prev_pos, options):
+                tally.before[(prev_word, prev_pos, f"{prev_word} {phrase}")] += 1
+                record(("قبل", prev_word), seg, (corpus_name, seg, i - 1, end))
+        if mode in ["هر دو", "کلمه بعدی"] and end < seg_end:
+            next_word, next_pos = words[tokens[end]], tags[pos_ids[end]]
+            if not has_filters or passes_filters(next_word, next_pos, options):
+                tally.after[(next_word, next_pos, f"{phrase} {next_word}")] += 1
+                record(("بعد", next_word), seg, (corpus_name, seg, i, end + 1))
+
+
+class CollocationRefs:
+    """
+    ارجاع‌های ردیف‌های یک جستجوی «کلمات مجاور» که هنگام شمارش نگه داشته نشده‌اند، به همان ترتیب
+    tally_collocations. units: (نام مجموعه، پیکره، پرسش، محدوده، بازه، برچسب). برای کلمه قبل/بعد، خود کلمه
+    به پرسش افزوده می‌شود تا فقط رخدادهای همان ردیف از نمایه خوانده شوند؛ بقیه ردیف‌ها (و پرسش‌های با
+    فاصله متغیر، که یک شروع ممکن است چند پایان داشته باشد) از یک شمارش کامل که یک بار انجام می‌شود.
+    """
+
+    def __init__(self, units, options: dict):
+        self.units, self.options = units, options
+        self.fixed_length = not any(element[0] == 'gap' and element[1] != element[2]
+                                    for unit in units for element in unit[2])
+        self._tally = None
+        self._lock = threading.Lock()  # انتخاب ردیف و خروجی گرفتن ممکن است هم‌زمان از دو رشته صدا بزنند
+
+    def __call__(self, key: tuple) -> list[tuple]:
+        kind, value = key
+        if kind in ("قبل", "بعد") and self.fixed_length:
+            return self._neighbour_refs(kind, value)
+        with self._lock:
+            if self._tally is None:
+                tally = CollocationTally()
+                for corpus_name, corpus, compiled, scope, block, label in self.units:
+                    tally_collocations(tally, corpus_name, corpus, compiled, scope, block, label, self.options)
+                self._tally = tally
+        return self._tally.hit_refs if kind == "عبارت کلیدی" else self._tally.refs.get(key, [])
+
+    def _neighbour_refs(self, kind: str, value: str) -> list[tuple]:
+        layer, pos_tags, refs = self.options["group_layer"], self.options["pos_tags"], []
+        for corpus_name, corpus, compiled, scope, block, _ in self.units:
+            value_id = (corpus.lemma_ids if layer == 'lemma' else corpus.word_ids).get(value)
+            if value_id is None:
+                continue
+            slot = ('slot', layer, frozenset({value_id}))
+            extended = [slot] + compiled if kind == "قبل" else compiled + [slot]
+            for seg, start, end in iter_counted_hits(corpus, extended, *block, self.options["unique"], scope):
+                position = start if kind == "قبل" else end - 1
+                if pos_tags is None or corpus.tags[corpus.pos[position]] in pos_tags:
+                    refs.append((corpus_name, seg, start, end))
+        return refs
+
+
+# ==============================================================================
+# بخش اجرای موازی جستجو
+# بازه هر جستجو به چند shard (با تعداد توکن تقریباً برابر) تقسیم و در یک مجموعه پردازه ماندگار اجرا
+# می‌شود. هر پردازه کش ستونی را با mmap باز می‌کند؛ صفحه‌های فایل بین همه پردازه‌ها در حافظه مشترک
+# سیستم‌عامل هستند و فقط پرسش و شمارش‌های جزئی (بدون ارجاع‌ها) بین پردازه‌ها جابه‌جا می‌شوند.
+# پردازه‌ها با spawn ساخته می‌شوند (نه fork از برنامه‌ای که چند رشته دارد) و پیش از هر بازنویسی کش
+# بسته می‌شوند تا هیچ پردازه‌ای فایل را باز نگه ندارد.
+SEARCH_WORKERS = max(1, min(16, (os.cpu_count() or 1)))
+PARALLEL_MIN_POSTINGS = 20_000  # پرسش‌هایی با لنگر کم‌بسامدتر از این در همین پردازه اجرا می‌شوند
+
+_worker_corpora = {}  # مسیر کش -> (اثر انگشت فایل، پیکره mmap‌شده)؛ در هر پردازه کارگر
+
+
+def make_search_pool(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def query_anchor_postings(corpus: Corpus, compiled: list[tuple]) -> int:
+    """تعداد مکان‌های کم‌بسامدترین جزء پرسش در کل مجموعه (برآوردی از حجم کار جستجو)."""
+    costs = []
+    for _, layer, ids in (element for element in compiled if element[0] == 'slot' and element[1] != 'any'):
+        post_starts = corpus.layer(layer)[2]
+        costs.append(sum(post_starts[i + 1] - post_starts[i] for i in ids))
+    return min(costs, default=0)
+
+
+def split_segment_range(corpus: Corpus, seg_lo: int, seg_hi: int, parts: int) -> list[tuple[int, int]]:
+    """بازه بخش‌ها را به حداکثر parts تکه پیوسته با تعداد توکن تقریباً برابر تقسیم می‌کند."""
+    seg_starts = corpus.seg_starts
+    token_lo, token_hi = seg_starts[seg_lo], seg_starts[seg_hi]
+    bounds = [seg_lo]
+    for part in range(1, parts):
+        target = token_lo + (token_hi - token_lo) * part // parts
+        bounds.append(min(max(bisect_left(seg_starts, target, seg_lo, seg_hi), bounds[-1]), seg_hi))
+    bounds.append(seg_hi)
+    return [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if lo < hi]
+
+
+def _shard_worker(cache_path: str, fingerprint: str, corpus_name: str, compiled: list[tuple],
+                  scope: tuple[int, int], block: tuple[int, int], label: str, options: dict):
+    """
+    اجرای یک shard در پردازه کارگر. اگر پیکره روی دیسک لایه لازم (مثلاً بن) را نداشته باشد None برمی‌گرداند
+    تا همان shard در پردازه اصلی اجرا شود. نگاشت نسخه قدیمی یک کش (با اثر انگشت دیگر) رها می‌شود.
+    """
+    cached = _worker_corpora.get(cache_path)
+    if cached is None or cached[0] != fingerprint:
+        _worker_corpora.pop(cache_path, None)
+        corpus = load_corpus_cache(cache_path, use_mmap=True)[0]
+        corpus.ensure_layers()
+        cached = _worker_corpora[cache_path] = (fingerprint, corpus)
+    corpus = cached[1]
+    if options["group_layer"] == 'lemma' or any(element[1] == 'lemma' for element in compiled):
+        if not corpus.has_lemmas():
+            return None
+    tally = CollocationTally(keep_refs=False)
+    tally_collocations(tally, corpus_name, corpus, compiled, scope, block, label, options)
+    return tally
+
+
+def parallel_tally(pool: ProcessPoolExecutor, workers: int, jobs, options: dict) -> CollocationTally:
+    """
+    jobs: (نام مجموعه، پیکره، مسیر کش mmap‌پذیر یا None، پرسش، محدوده، بازه، برچسب). بازه هر کار به تعداد
+    پردازه‌ها shard می‌شود و شمارش‌ها (بدون ارجاع‌ها؛ آن‌ها با CollocationRefs پیدا می‌شوند) جمع زده می‌شوند.
+    کارهایی بدون مسیر کش (یا shardهایی که کارگر نتوانست اجرا کند) در همین پردازه شمرده می‌شوند.
+    """
+    pending = []
+    for corpus_name, corpus, cache_path, compiled, scope, block, label in jobs:
+        fingerprint = file_fingerprint(cache_path) if cache_path else None
+        for shard in split_segment_range(corpus, *block, workers) if fingerprint else [block]:
+            future = pool.submit(_shard_worker, cache_path, fingerprint, corpus_name, compiled, scope, shard,
+                                 label, options) if fingerprint else None
+            pending.append((future, (corpus_name, corpus, compiled, scope, shard, label)))
+    tally = CollocationTally(keep_refs=False)
+    for future, job in pending:
+        shard_tally = future.result() if future is not None else None
+        if shard_tally is None:
+            shard_tally = CollocationTally(keep_refs=False)
+            tally_collocations(shard_tally, *job, options)
+        tally.merge(shard_tally)
+    return tally
+
+
+def benchmark_parallel_search(cache_path: str, query: str, worker_counts=(1, 2, 4, 8), repeats: int = 3):
+    """
+    یک پرسش «کلمات مجاور» را روی کش ستونی با تعداد پردازه‌های مختلف اجرا کرده و زمان هر اجرا و تسریع آن
+    نسبت به اجرای ترتیبی برنامه (در همین پردازه و همراه با ارجاع‌ها) را چاپ می‌کند. نقش‌ها با تگ مدل
+    نوشته می‌شوند، مثلاً [NOUN] (که NOUN,EZ را هم در بر می‌گیرد).
+    """
+    from hazm import Normalizer, word_tokenize
+    corpus = load_corpus_cache(cache_path, use_mmap=True)[0]
+    corpus.ensure_layers()
+    pos_map = defaultdict(set)
+    for tag in corpus.tags:
+        pos_map[tag.split(',')[0]].add(tag)
+        pos_map[tag].add(tag)
+    try:
+        parts = parse_query(query, Normalizer(), word_tokenize, pos_map)
+    except ValueError as e:
+        print(e)
+        return
+    compiled = compile_query(parts, corpus, 'word', None)
+    if compiled is None:
+        print(f"'{query}' در پیکره یافت نشد.")
+        return
+    options = {"unique": False, "group_layer": "word", "mode": "هر دو", "is_pattern": not is_literal_query(parts),
+               "phrase": query, "direct_key": ("عبارت کلیدی", query), "pos_tags": None,
+               "condition_type": "فرقی نمی‌کند", "condition_value": ""}
+    scope = (0, len(corpus))
+
+    def best_time(run):
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            tally = run()
+            timings.append(time.perf_counter() - started)
+        return min(timings), tally
+
+    def sequential():
+        tally = CollocationTally()
+        tally_collocations(tally, "", corpus, compiled, scope, scope, "", options)
+        return tally
+
+    baseline, expected = best_time(sequential)
+    print(f"پرس‌وجو: {query} | رخدادها: {expected.hits} | لنگر: {query_anchor_postings(corpus, compiled)} مکان")
+    print(f"ترتیبی (همین پردازه، همراه با ارجاع‌ها): {baseline:.3f} ثانیه")
+    for workers in worker_counts:
+        with make_search_pool(workers) as pool:
+            job = [("", corpus, cache_path, compiled, scope, scope, "")]
+            parallel_tally(pool, workers, job, options)  # گرم کردن: هر کارگر کش را یک بار mmap می‌کند
+            elapsed, tally = best_time(lambda: parallel_tally(pool, workers, job, options))
+        status = "" if (tally.hits, tally.before, tally.after, tally.pattern) == \
+            (expected.hits, expected.before, expected.after, expected.pattern) else " (نتیجه متفاوت!)"
+        print(f"{workers} پردازه: {elapsed:.3f} ثانیه، تسریع {baseline / elapsed:.2f}x{status}")
+
+
+KEYNESS_MEASURES = ("log-likelihood", "%DIFF")
+
+
+def keyness_scores(counts_a, counts_b, total_a: int, total_b: int) -> tuple:
+    """
+    کلیدی بودن هر ردیف در گروه الف نسبت به گروه ب: (log-likelihood، ‎%DIFF) به صورت آرایه‌های numpy
+    که یک‌جا روی آرایه‌های فراوانی محاسبه می‌شوند. total_a و total_b اندازه هر گروه هستند.
+    """
+    import numpy as np
+    a, b = np.asarray(counts_a, dtype=float), np.asarray(counts_b, dtype=float)
+    total = total_a + total_b
+    expected_a, expected_b = total_a * (a + b) / total, total_b * (a + b) / total
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_likelihood = 2 * (np.where(a > 0, a * np.log(a / expected_a), 0.0) +
+                              np.where(b > 0, b * np.log(b / expected_b), 0.0))
+        freq_a = a / total_a if total_a else np.zeros_like(a)
+        freq_b = b / total_b if total_b else np.zeros_like(b)
+        pct_diff = (freq_a - freq_b) * 100 / freq_b  # بی‌نهایت یعنی در گروه ب اصلاً نیامده است
+    return log_likelihood, pct_diff
+
+
+# ==============================================================================
+# بخش جدول‌های n-gram (کشف هم‌نشین‌ها بدون کلیدواژه)
+# برای n=2 و n=3 دو جدول مرتب روی دیسک ساخته می‌شود: 'word' (کلید: شناسه کلمات) و 'wordpos'
+# (کلید: شناسه نقش‌ها و سپس شناسه کلمات، تا ردیف‌های هر ترکیب نقش بازه‌ای پیوسته باشند).
+# شمارش در تکه‌های محدود انجام و هر تکه مرتب‌شده در یک فایل موقت ریخته می‌شود؛ سپس تکه‌ها
+# با ادغام k-راهه جمع زده و n-gramهای کم‌بسامدتر از min_count حذف می‌شوند.
+NGRAM_MIN_COUNT = 3
+NGRAM_RUN_ENTRIES = 2_000_000  # بیشینه کلیدهای متمایز در حافظه پیش از ریختن یک تکه مرتب روی دیسک
+NGRAM_MEASURES = ("t-score", "MI", "فراوانی")
+NGRAM_TABLES_VERSION = 2  # ۲: امتیاز و ترتیب ردیف‌ها برای هر معیار هنگام ساخت ذخیره می‌شود
+
+
+def _ngram_typecode(name: str) -> str | None:
+    column = name.rsplit('_', 1)[-1]
+    if column in ('count',) or column.startswith('w'):
+        return 'i'
+    if column.startswith('p'):
+        return 'H'
+    if column == 'key':
+        return 'q'
+    if column.startswith('score'):
+        return 'd'
+    if column.startswith('rank'):
+        return 'i'
+    return None
+
+
+def _spill_run(counter: dict, key_len: int, tmp_dir) -> str:
+    """یک تکه شمارش را مرتب کرده و به صورت رکوردهای ثابت‌طول در فایل موقت می‌نویسد."""
+    record = struct.Struct(f'<{key_len + 1}i')
+    fd, path = tempfile.mkstemp(suffix='.run', dir=tmp_dir)
+    with os.fdopen(fd, 'wb') as f:
+        for key in sorted(counter):
+            f.write(record.pack(*key, counter[key]))
+    counter.clear()
+    return path
+
+
+def _iter_run(path: str, key_len: int, block_records: int = 65536):
+    record = struct.Struct(f'<{key_len + 1}i')
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(record.size * block_records)
+            if not block:
+                break
+            for values in record.iter_unpack(block):
+                yield values[:-1], values[-1]
+
+
+class NgramTables:
+    """جدول‌های فراوانی دوتایی و سه‌تایی یک پیکره؛ هر جدول مجموعه‌ای از ستون‌های مرتب است."""
+
+    def __init__(self, columns: dict | None = None, header: dict | None = None):
+        self.columns = columns or {}
+        self.header = header or {}
+        self._mmap = None
+
+    @classmethod
+    def build(cls, corpus: Corpus, min_count: int = NGRAM_MIN_COUNT, run_entries: int = NGRAM_RUN_ENTRIES,
+              tmp_dir=None, progress=None) -> 'NgramTables':
+        """
+        n-gramهای داخل هر بخش را می‌شمارد (از مرز بخش‌ها عبور نمی‌کند). حافظه مصرفی به
+        run_entries کلید برای هر جدول محدود است و بقیه کار با ادغام فایل‌های مرتب انجام می‌شود.
+        """
+        tokens, pos, seg_starts = corpus.tokens, corpus.pos, corpus.seg_starts
+        key_lens = {(n, layer): n if layer == 'word' else 2 * n for n in (2, 3) for layer in ('word', 'wordpos')}
+        counters = {table: {} for table in key_lens}
+        runs = {table: [] for table in key_lens}
+        unigrams = Counter()
+        tag_count = max(len(corpus.tags), 1)
+        try:
+            for seg in range(len(corpus)):
+                lo, hi = seg_starts[seg], seg_starts[seg + 1]
+                seg_words, seg_pos = tokens[lo:hi], pos[lo:hi]
+                unigrams.update(word * tag_count + tag for word, tag in zip(seg_words, seg_pos))
+                for n in (2, 3):
+                    word_counter, wordpos_counter = counters[(n, 'word')], counters[(n, 'wordpos')]
+                    for i in range(len(seg_words) - n + 1):
+                        words = tuple(seg_words[i:i + n])
+                        word_counter[words] = word_counter.get(words, 0) + 1
+                        key = tuple(seg_pos[i:i + n]) + words
+                        wordpos_counter[key] = wordpos_counter.get(key, 0) + 1
+                for table, counter in counters.items():
+                    if len(counter) >= run_entries:
+                        runs[table].append(_spill_run(counter, key_lens[table], tmp_dir))
+                if progress and seg % 5000 == 0:
+                    progress(seg / max(len(corpus), 1))
+
+            columns = {}
+            for table, key_len in key_lens.items():
+                n, layer = table
+                prefix = f"{n}_{layer}_"
+                names = [f"p{k + 1}" for k in range(n)] + [f"w{k + 1}" for k in range(n)] if layer == 'wordpos' \
+                    else [f"w{k + 1}" for k in range(n)]
+                out = {name: array(_ngram_typecode(name)) for name in names}
+                counts, pos_keys = array('i'), array('q')
+                sources = [_iter_run(path, key_len) for path in runs[table]]
+                sources.append(iter(sorted(counters[table].items())))
+                current_key, current_count = None, 0
+
+                def emit(key, count):
+                    if count < min_count:
+                        return
+                    for name, value in zip(names, key):
+                        out[name].append(value)
+                    counts.append(count)
+                    if layer == 'wordpos':
+                        pos_key = 0
+                        for tag in key[:n]:
+                            pos_key = pos_key * tag_count + tag
+                        pos_keys.append(pos_key)
+
+                for key, count in heapq.merge(*sources):
+                    if key == current_key:
+                        current_count += count
+                    else:
+                        if current_key is not None:
+                            emit(current_key, current_count)
+                        current_key, current_count = key, count
+                if current_key is not None:
+                    emit(current_key, current_count)
+                counters[table].clear()
+                for name, values in out.items():
+                    columns[prefix + name] = values
+                columns[prefix + "count"] = counts
+                if layer == 'wordpos':
+                    columns[prefix + "key"] = pos_keys
+        finally:
+            for paths in runs.values():
+                for path in paths:
+                    os.remove(path)
+
+        unigram_keys = array('q', sorted(unigrams))
+        columns["1_wordpos_key"] = unigram_keys
+        columns["1_wordpos_count"] = array('i', (unigrams[key] for key in unigram_keys))
+        header = {"corpus_stats": corpus.stats(), "tag_count": tag_count, "min_count": min_count,
+                  "version": NGRAM_TABLES_VERSION}
+        tables = cls(columns, header)
+        tables._rank(corpus)
+        return tables
+
+    def _rank(self, corpus: Corpus):
+        """
+        امتیاز t-score و MI هر ردیف (با فرض استقلال اجزا، از فراوانی تک‌کلمه‌ها) و ترتیب نزولی ردیف‌ها برای
+        هر معیار را یک بار محاسبه می‌کند تا top بدون فیلتر نقش فقط k ردیف اول را بخواند.
+        """
+        total = max(corpus.token_count, 1)
+        tag_count = self.header["tag_count"]
+        unigram_keys, unigram_counts = self.columns["1_wordpos_key"], self.columns["1_wordpos_count"]
+        post_starts = corpus.word_post_starts
+        for n in (2, 3):
+            for layer in ('word', 'wordpos'):
+                prefix = f"{n}_{layer}_"
+                counts = self.columns[prefix + "count"]
+                expected = [total] * len(counts)
+                for i in range(n):
+                    words = self.columns[f"{prefix}w{i + 1}"]
+                    if layer == 'wordpos':
+                        tags = self.columns[f"{prefix}p{i + 1}"]
+                        unigrams = (unigram_counts[bisect_left(unigram_keys, word * tag_count + tag)]
+                                    for word, tag in zip(words, tags))
+                    else:
+                        unigrams = (post_starts[word + 1] - post_starts[word] for word in words)
+                    expected = [value * (unigram / total) for value, unigram in zip(expected, unigrams)]
+                t_scores = array('d', ((observed - value) / math.sqrt(observed)
+                                       for observed, value in zip(counts, expected)))
+                mi_scores = array('d', (math.log2(observed / value) for observed, value in zip(counts, expected)))
+                self.columns[prefix + "score0"], self.columns[prefix + "score1"] = t_scores, mi_scores
+                for m, scores in enumerate((t_scores, mi_scores, counts)):
+                    # مرتب‌سازی پایدار روی ردیف‌های وارونه: در امتیاز برابر، ردیف بزرگ‌تر اول (مانند top با فیلتر)
+                    self.columns[f"{prefix}rank{m}"] = array('i', sorted(
+                        range(len(counts) - 1, -1, -1), key=scores.__getitem__, reverse=True))
+
+    def save(self, path):
+        write_sections_file(path, {"ngram_tables": self.header},
+                            {name: ('array', values) for name, values in self.columns.items()})
+
+    @classmethod
+    def load(cls, path, use_mmap: bool = True) -> 'NgramTables':
+        header, sections, mm = read_sections_file(path, _ngram_typecode, use_mmap)
+        tables = cls(sections, header.get("ngram_tables", {}))
+        tables._mmap = mm
+        return tables
+
+    def matches(self, corpus: Corpus) -> bool:
+        """آیا جدول‌ها از همین پیکره (با همین شناسه‌ها) ساخته شده‌اند؟"""
+        return self.header.get("corpus_stats") == corpus.stats() and \
+            self.header.get("tag_count") == max(len(corpus.tags), 1) and \
+            self.header.get("version") == NGRAM_TABLES_VERSION
+
+    def _rows(self, n: int, layer: str, tag_sets: list | None):
+        """اندیس ردیف‌های جدول؛ با فیلتر نقش، فقط بازه‌های پیوسته ترکیب‌های مجاز پیموده می‌شوند."""
+        prefix = f"{n}_{layer}_"
+        size = len(self.columns[prefix + "count"])
+        if layer == 'word' or not tag_sets or all(tags is None for tags in tag_sets):
+            yield from range(size)
+            return
+        tag_count, pos_keys = self.header["tag_count"], self.columns[prefix + "key"]
+        fixed = 0
+        while fixed < n and tag_sets[fixed] is not None:
+            fixed += 1
+        later = [(k, tag_sets[k]) for k in range(fixed, n) if tag_sets[k] is not None]
+        pos_columns = [self.columns[f"{prefix}p{k + 1}"] for k in range(n)]
+        span = tag_count ** (n - fixed)
+        for combo in sorted(product(*tag_sets[:fixed])):
+            base = 0
+            for tag in combo:
+                base = base * tag_count + tag
+            lo = bisect_left(pos_keys, base * span)
+            hi = bisect_left(pos_keys, (base + 1) * span, lo)
+            for row in range(lo, hi):
+                if all(pos_columns[k][row] in tags for k, tags in later):
+                    yield row
+
+    def top(self, corpus: Corpus, n: int = 2, layer: str = 'word', tag_sets: list | None = None,
+            measure: str = "t-score", k: int = 200) -> list[tuple]:
+        """
+        k ترکیب قوی‌تر را برمی‌گرداند: (شناسه کلمات، شناسه نقش‌ها یا None، فراوانی، امتیاز).
+        tag_sets برای هر جایگاه مجموعه شناسه نقش‌های مجاز یا None (هر نقشی) است.
+        امتیازها و ترتیب ردیف‌ها هنگام ساخت جدول محاسبه شده‌اند؛ بدون فیلتر نقش فقط k ردیف اول ترتیب خوانده
+        می‌شود. اگر نقش جایگاه اول تعیین شده باشد، فقط ردیف‌های بازه‌های نقش‌های مجاز با امتیاز ذخیره‌شده
+        مقایسه می‌شوند و در غیر این صورت ترتیب از ابتدا پیموده می‌شود تا k ردیف مجاز پیدا شود.
+        """
+        prefix = f"{n}_{layer}_"
+        measure_index = NGRAM_MEASURES.index(measure)
+        counts = self.columns[prefix + "count"]
+        scores = counts if measure == "فراوانی" else self.columns[f"{prefix}score{measure_index}"]
+        word_columns = [self.columns[f"{prefix}w{i + 1}"] for i in range(n)]
+        pos_columns = [self.columns[f"{prefix}p{i + 1}"] for i in range(n)] if layer == 'wordpos' else None
+        rank = self.columns[f"{prefix}rank{measure_index}"]
+        if layer == 'word' or not tag_sets or all(tags is None for tags in tag_sets):
+            best = rank[:k]
+        elif tag_sets[0] is not None:
+            best = heapq.nlargest(k, self._rows(n, layer, tag_sets), key=lambda row: (scores[row], row))
+        else:
+            allowed = [(pos_columns[i], tags) for i, tags in enumerate(tag_sets) if tags is not None]
+            best = list(islice((row for row in rank if all(column[row] in tags for column, tags in allowed)), k))
+        return [(tuple(column[row] for column in word_columns),
+                 tuple(column[row] for column in pos_columns) if pos_columns else None,
+                 counts[row], scores[row]) for row in best]
+
+
+# ==============================================================================
+# بخش خروجی جریانی (xlsx / csv / parquet)
+EXPORT_FILETYPES = [("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("Parquet files", "*.parquet"),
+                    ("All files", "*.*")]
+XLSX_MAX_ROWS = 1_048_576
+PARQUET_BATCH_ROWS = 10_000
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def write_table(path, columns, rows, progress=None, cancel_event=None) -> int:
+    """
+    ردیف‌ها را به صورت جریانی (با حافظه ثابت) در فایل می‌نویسد؛ قالب از پسوند فایل تعیین می‌شود.
+    progress(تعداد ردیف) هر چند هزار ردیف صدا زده می‌شود. با تنظیم cancel_event فایل ناقص
+    حذف و ExportCancelled پرتاب می‌شود. تعداد ردیف‌های نوشته‌شده را برمی‌گرداند.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    tmp_path = path.with_name(path.name + '.tmp')
+    count = 0
+
+    def checked(row_iter):
+        nonlocal count
+        for row in row_iter:
+            yield row
+            count += 1
+            if count % 2000 == 0:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ExportCancelled()
+                if progress:
+                    progress(count)
+
+    try:
+        if suffix == '.csv':
+            import csv
+            # utf-8-sig تا اکسل متن فارسی را درست باز کند
+            with open(tmp_path, 'w', encoding='utf-8-sig', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(checked(rows))
+        elif suffix == '.parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            writer, batch = None, []
+
+            def flush():
+                nonlocal writer
+                data = {col: [row[i] for row in batch] for i, col in enumerate(columns)}
+                table = pa.Table.from_pydict(data, schema=writer.schema if writer else None)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table)
+                batch.clear()
+
+            try:
+                for row in checked(rows):
+                    batch.append(row)
+                    if len(batch) >= PARQUET_BATCH_ROWS:
+                        flush()
+                if batch or writer is None:
+                    flush()
+            finally:
+                if writer is not None:
+                    writer.close()
+        else:
+            from openpyxl import Workbook
+            workbook = Workbook(write_only=True)
+            sheet, sheet_rows = None, XLSX_MAX_ROWS
+            for row in checked(rows):
+                # هر برگه اکسل حداکثر ~یک میلیون ردیف دارد؛ باقی ردیف‌ها در برگه بعدی نوشته می‌شوند
+                if sheet_rows >= XLSX_MAX_ROWS:
+                    sheet = workbook.create_sheet(f"Sheet{len(workbook.worksheets) + 1}")
+                    sheet.append(list(columns))
+                    sheet_rows = 1
+                sheet.append(list(row))
+                sheet_rows += 1
+            if sheet is None:
+                workbook.create_sheet("Sheet1").append(list(columns))
+            workbook.save(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+        raise
+    return count
+
 # ==============================================================================
 # کلاس اصلی برنامه
 class TextAnalyzerApp:
@@ -128,22 +1781,22 @@ class TextAnalyzerApp:
         except tk.TclError:
             pass
         self.MAX_WORDS, self.IDEAL_WORDS = 250, 150
-        self.tagged_data, self.sentence_mapping, self.last_search_phrase = [], defaultdict(list), ""
+        self.CACHE_COMPRESSION = None  # "zstd" یا "lz4" (در صورت نصب بودن کتابخانه مربوطه)
+        self.corpus, self.sentence_mapping, self.last_search_phrase = None, defaultdict(list), ""
         self.direct_phrase_sources = defaultdict(list)
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
-        self.cache_path = os.path.join(self.script_dir, 'preprocessed_data.pkl')
-        try:
-            model_path = os.path.join(self.script_dir, 'pos_tagger.model')
-            if not os.path.exists(model_path):
-                messagebox.showerror("فایل مدل یافت نشد", f"فایل 'pos_tagger.model' یافت نشد.")
-                self.root.destroy();
-                return
-            self.normalizer = Normalizer()
-            self.pos_tagger = POSTagger(model=model_path)
-        except Exception as e:
-            messagebox.showerror("خطای Hazm", f"خطا در بارگذاری مدل‌های Hazm:\n{e}")
-            self.root.destroy();
-            return
+        # مجموعه‌های نام‌دار؛ فقط مجموعه فعال کامل در حافظه است و بقیه به صورت mmap باز می‌شوند
+        self.registry = CorpusRegistry(self.script_dir)
+        self.corpora = {}
+        self.search_pool = None  # پردازه‌های ماندگار جستجوی موازی (با اولین پرسش پرکار ساخته می‌شود)
+        self.ngram_tables = {}  # نام مجموعه -> NgramTables (با mmap از فایل .ngrams کنار کش)
+        self.active_corpus_name = self.registry.active
+        self.cache_path = self.registry.cache_path(self.active_corpus_name)
+        self.legacy_cache_path = os.path.join(self.script_dir, 'preprocessed_data.pkl')
+        self.model_path = os.path.join(self.script_dir, 'pos_tagger.model')
+        # مدل‌های hazm به صورت تنبل (lazy) و در پس‌زمینه بارگذاری می‌شوند
+        self.normalizer, self.pos_tagger, self.lemmatizer = None, None, None
+        self._hazm_lock = threading.Lock()
         # نقشه تگ‌های دستوری به نام‌های فارسی
         self.pos_map = {
             "اسم": {"NOUN", "NOUN,EZ"}, "فعل": {"VERB"}, "صفت": {"ADJ", "ADJ,EZ"},
@@ -157,10 +1810,34 @@ class TextAnalyzerApp:
         # *** FIXED ***: متغیر برای منوی کشویی مدل هایلایت با مقدار پیش‌فرض صحیح
         self.highlight_model_var = tk.StringVar(value="مدل ۲ (معکوس کامل)")
         self.current_found_word = None
+        self.current_dispersion = None
         self.current_source_sentences_for_export = []
+        # رخدادهای (مجموعه، بخش، توکن شروع، توکن پایان) ردیف انتخاب‌شده برای نمایش KWIC
+        self.current_source_hits = []
+        self.KWIC_WIDTH = 60
+        # مدل نتایج جدول (ردیف‌های ۷تایی)؛ خروجی‌ها از این مدل خوانده می‌شوند نه از Treeview
+        self.current_results = []
+        self.export_thread, self.export_cancel_event = None, threading.Event()
+        # جملات منبع صفحه‌به‌صفحه نمایش داده می‌شوند؛ شماره خط پیوند هر کتاب -> مسیر فایل آن
+        self.SOURCE_PAGE_SIZE = 50
+        self.source_rendered_count = 0
+        self.source_link_targets = {}
+        self._source_page_pending = False
+        # (موقعیت، کلمه) -> Counter فراوانی به تفکیک (مجموعه، کتاب)
+        self.dispersion = defaultdict(Counter)
+        # کلید ردیف -> تابعی که ارجاع‌های آن را برمی‌گرداند؛ برای ردیف‌هایی که رخدادهایشان فقط با انتخاب
+        # ردیف (یا خروجی گرفتن) از نمایه خوانده می‌شوند («کشف» و جستجوهای موازی)
+        self.lazy_sources = {}
+        self.resolving_sources = {}  # کلید ردیف -> تابع ارجاع‌هایی که در پس‌زمینه در حال اجراست
+        self.loading = False  # در حین بارگذاری یا بازسازی کش، پایان جستجوی قبلی دکمه جستجو را فعال نمی‌کند
         self._create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
         self.root.after(100, self._initiate_loading_process)
 
+    def _on_close(self):
+        self._shutdown_search_pool()
+        self.root.destroy()
+
     def _create_widgets(self):
         main_frame = ttk.Frame(self.root, padding="10")
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -173,7 +1850,7 @@ class TextAnalyzerApp:
         search_controls_main_frame.pack(fill=tk.X, side=tk.TOP, pady=5)
 
         self.search_type_var = tk.StringVar(value="کلمات مجاور")
-        search_type_choices = ["کلمات مجاور", "عین عبارت کلیدی"]
+        search_type_choices = ["کلمات مجاور", "عین عبارت کلیدی", "کشف هم‌نشین‌ها"]
         self.search_type_combo = ttk.Combobox(search_controls_main_frame, textvariable=self.search_type_var,
                                               values=search_type_choices, state="readonly", width=15, justify='right')
         ttk.Label(search_controls_main_frame, text=":نوع جستجو").pack(side=tk.RIGHT, padx=(2, 0), pady=5)
@@ -208,6 +1885,63 @@ class TextAnalyzerApp:
         self.pos_combo = ttk.Combobox(self.collocation_tools_frame, textvariable=self.pos_var, values=pos_options,
                                       state="readonly", width=10, justify='right')
         self.pos_combo.grid(row=0, column=6, padx=(0, 1), pady=1, sticky=tk.EW)
+        # تطبیق عبارت کلیدی و گروه‌بندی کلمات هم‌نشین بر اساس صورت کلمه یا بن آن
+        ttk.Label(self.collocation_tools_frame, text="تطبیق:").grid(row=0, column=7, padx=(2, 1), pady=1,
+                                                                        sticky=tk.E)
+        self.match_by_var = tk.StringVar(value="صورت")
+        self.match_by_combo = ttk.Combobox(self.collocation_tools_frame, textvariable=self.match_by_var,
+                                           values=["صورت", "بن"], state="readonly", width=6, justify='right')
+        self.match_by_combo.grid(row=0, column=8, padx=(0, 2), pady=1, sticky=tk.EW)
+        ttk.Label(self.collocation_tools_frame, text="گروه‌بندی:").grid(row=0, column=9, padx=(2, 1), pady=1,
+                                                                          sticky=tk.E)
+        self.group_by_var = tk.StringVar(value="صورت")
+        self.group_by_combo = ttk.Combobox(self.collocation_tools_frame, textvariable=self.group_by_var,
+                                           values=["صورت", "بن"], state="readonly", width=6, justify='right')
+        self.group_by_combo.grid(row=0, column=10, padx=(0, 1), pady=1, sticky=tk.EW)
+        # جستجوی تقریبی برای کلیدواژه‌های بسیار پربسامد: نمونه‌گیری از بخش‌ها با بودجه زمانی
+        self.approximate_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.collocation_tools_frame, text="تقریبی", variable=self.approximate_var).grid(
+            row=0, column=11, padx=(2, 1), pady=1, sticky=tk.E)
+        # مقایسه هم‌نشین‌های کلیدواژه بین دو گروه از کتاب‌ها (دو پوشه یا کتاب) در یک اجرا
+        ttk.Label(self.collocation_tools_frame, text="مقایسه:").grid(row=1, column=0, padx=(0, 1), pady=1,
+                                                                         sticky=tk.E)
+        self.compare_a_var, self.compare_b_var = tk.StringVar(value="بدون مقایسه"), tk.StringVar(value="بدون مقایسه")
+        self.compare_a_combo = ttk.Combobox(self.collocation_tools_frame, textvariable=self.compare_a_var,
+                                            values=["بدون مقایسه"], state="readonly", width=18, justify='right')
+        self.compare_a_combo.grid(row=1, column=1, columnspan=3, padx=(0, 2), pady=1, sticky=tk.EW)
+        ttk.Label(self.collocation_tools_frame, text="با:").grid(row=1, column=4, padx=(2, 1), pady=1, sticky=tk.E)
+        self.compare_b_combo = ttk.Combobox(self.collocation_tools_frame, textvariable=self.compare_b_var,
+                                            values=["بدون مقایسه"], state="readonly", width=18, justify='right')
+        self.compare_b_combo.grid(row=1, column=5, columnspan=3, padx=(0, 2), pady=1, sticky=tk.EW)
+        ttk.Label(self.collocation_tools_frame, text="معیار:").grid(row=1, column=8, padx=(2, 1), pady=1,
+                                                                        sticky=tk.E)
+        self.keyness_measure_var = tk.StringVar(value=KEYNESS_MEASURES[0])
+        ttk.Combobox(self.collocation_tools_frame, textvariable=self.keyness_measure_var, values=KEYNESS_MEASURES,
+                     state="readonly", width=12, justify='right').grid(row=1, column=9, columnspan=2, padx=(0, 1),
+                                                                       pady=1, sticky=tk.EW)
+
+        # کشف هم‌نشین‌ها بدون کلیدواژه از روی جدول‌های n-gram (کادر جستجو در این حالت اختیاری است)
+        self.discovery_tools_frame = ttk.Frame(search_controls_main_frame, padding="3", relief="groove", borderwidth=1)
+        ttk.Label(self.discovery_tools_frame, text="طول:").grid(row=0, column=0, padx=(0, 1), pady=1, sticky=tk.E)
+        self.ngram_size_var = tk.StringVar(value="2")
+        ttk.Combobox(self.discovery_tools_frame, textvariable=self.ngram_size_var, values=["2", "3"],
+                     state="readonly", width=3, justify='right').grid(row=0, column=1, padx=(0, 2), pady=1)
+        ttk.Label(self.discovery_tools_frame, text="لایه:").grid(row=0, column=2, padx=(2, 1), pady=1, sticky=tk.E)
+        self.ngram_layer_var = tk.StringVar(value="صورت")
+        ttk.Combobox(self.discovery_tools_frame, textvariable=self.ngram_layer_var, values=["صورت", "صورت+نقش"],
+                     state="readonly", width=9, justify='right').grid(row=0, column=3, padx=(0, 2), pady=1)
+        self.ngram_pos_vars = []
+        for slot in range(3):
+            ttk.Label(self.discovery_tools_frame, text=f"نقش {slot + 1}:").grid(row=0, column=4 + 2 * slot,
+                                                                              padx=(2, 1), pady=1, sticky=tk.E)
+            pos_var = tk.StringVar(value="هر نقشی")
+            ttk.Combobox(self.discovery_tools_frame, textvariable=pos_var, values=pos_options, state="readonly",
+                         width=10, justify='right').grid(row=0, column=5 + 2 * slot, padx=(0, 2), pady=1)
+            self.ngram_pos_vars.append(pos_var)
+        ttk.Label(self.discovery_tools_frame, text="معیار:").grid(row=0, column=10, padx=(2, 1), pady=1, sticky=tk.E)
+        self.ngram_measure_var = tk.StringVar(value=NGRAM_MEASURES[0])
+        ttk.Combobox(self.discovery_tools_frame, textvariable=self.ngram_measure_var, values=NGRAM_MEASURES,
+                     state="readonly", width=8, justify='right').grid(row=0, column=11, padx=(0, 1), pady=1)
 
         self.search_button = ttk.Button(search_controls_main_frame, text="جستجو", command=self._start_search,
                                         state=tk.DISABLED)
@@ -223,6 +1957,22 @@ class TextAnalyzerApp:
         self.highlight_model_combo.pack(side=tk.LEFT, padx=(10, 5), pady=5)
         self.highlight_model_combo.bind("<<ComboboxSelected>>", self._on_highlight_option_change)
         ttk.Label(search_controls_main_frame, text=":مدل هایلایت").pack(side=tk.LEFT, padx=(2, 0), pady=5)
+        # نمایش رخدادها به صورت سطرهای KWIC (بافت پیشین | کلیدواژه | بافت پسین) به جای جمله کامل
+        self.kwic_view_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_controls_main_frame, text="نمایش KWIC", variable=self.kwic_view_var,
+                        command=self._apply_or_remove_highlights).pack(side=tk.LEFT, padx=(10, 5), pady=5)
+        # شمارش همه رخدادها یا فقط یک بار برای هر متن تکراری (چاپ‌ها و فصل‌های کپی‌شده)
+        self.count_mode_var = tk.StringVar(value="همه رخدادها")
+        ttk.Combobox(search_controls_main_frame, textvariable=self.count_mode_var,
+                     values=["همه رخدادها", "فقط یکتا"], state="readonly", width=12,
+                     justify='right').pack(side=tk.LEFT, padx=(10, 5), pady=5)
+        ttk.Label(search_controls_main_frame, text=":شمارش").pack(side=tk.LEFT, padx=(2, 0), pady=5)
+        # محدود کردن جستجو به یک زیرپوشه یا کتاب از پوشه اصلی
+        self.facet_var = tk.StringVar(value="کل مجموعه")
+        self.facet_combo = ttk.Combobox(search_controls_main_frame, textvariable=self.facet_var,
+                                        values=["کل مجموعه"], state="readonly", width=25, justify='right')
+        self.facet_combo.pack(side=tk.LEFT, padx=(10, 5), pady=5)
+        ttk.Label(search_controls_main_frame, text=":محدوده").pack(side=tk.LEFT, padx=(2, 0), pady=5)
 
         self._on_search_type_change()
         self._toggle_condition_entry()
@@ -234,7 +1984,7 @@ class TextAnalyzerApp:
         output_pane.pack(fill=tk.BOTH, expand=True, pady=5)
         results_frame = tk.Frame(output_pane, bg='#cccccc', width=380, height=200)
 
-        cols = ("نمونه", "کلمه", "نقش دستوری", "فراوانی", "موقعیت")
+        cols = ("نمونه", "کلمه", "نقش دستوری", "فراوانی", "موقعیت", "مجموعه‌ها", "پراکندگی")
         self.results_tree = ttk.Treeview(results_frame, columns=cols, show='headings', style="Custom.Treeview")
         for col in cols:
             self.results_tree.heading(col, text=col, command=lambda c=col: self._sort_treeview(c, False))
@@ -244,6 +1994,8 @@ class TextAnalyzerApp:
         self.results_tree.column("نقش دستوری", width=120)
         self.results_tree.column("فراوانی", width=100)
         self.results_tree.column("موقعیت", width=100)
+        self.results_tree.column("مجموعه‌ها", width=180)
+        self.results_tree.column("پراکندگی", width=90)
 
         self.results_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.results_tree.bind("<<TreeviewSelect>>", self._on_result_click)
@@ -263,6 +2015,14 @@ class TextAnalyzerApp:
 
         self.source_text.tag_configure("rtl_align", justify='right')
         self.source_text.tag_configure("highlight_found", background="#ADD8E6", relief=tk.RAISED, borderwidth=1)
+        self.source_text.tag_configure("dispersion_info", foreground="#333366", font=("Tahoma", 10, "bold"))
+        # یک تگ مشترک برای همه پیوندهای کتاب؛ مقصد هر پیوند از روی شماره خط آن پیدا می‌شود
+        self.source_text.tag_configure("book_link", foreground="darkblue", underline=True)
+        self.source_text.tag_bind("book_link", "<Button-1>", self._on_book_link_click)
+        self.source_text.tag_configure("load_more", foreground="darkgreen", underline=True)
+        self.source_text.tag_bind("load_more", "<Button-1>", lambda e: self._render_source_page())
+        # بارگذاری صفحه بعد با رسیدن نوار پیمایش به انتهای متن
+        self.source_text.configure(yscrollcommand=self._on_source_scroll)
 
         # *** FIXED ***: بازگرداندن تعریف متغیر و نوار وضعیت
         self.results_count_var = tk.StringVar(value="")
@@ -274,17 +2034,32 @@ class TextAnalyzerApp:
         status_results_count_label = ttk.Label(status_bar_frame, textvariable=self.results_count_var, anchor=tk.E,
                                                font=('Tahoma', 9, 'bold'))
         status_results_count_label.pack(side=tk.RIGHT, padx=(0, 5), pady=2)
+        # فقط هنگام نوشتن خروجی نمایش داده می‌شود
+        self.export_cancel_button = ttk.Button(status_bar_frame, text="لغو خروجی",
+                                               command=self.export_cancel_event.set)
+        # فقط پس از یک جستجوی تقریبی نمایش داده می‌شود
+        self.exact_count_button = ttk.Button(status_bar_frame, text="شمارش دقیق", command=self._run_exact_count)
+        self.exact_count_params = None
 
         self.progressbar = ttk.Progressbar(self.root, orient='horizontal', mode='determinate')
 
         menubar = tk.Menu(self.root)
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="پردازش مجدد داده‌ها", command=self._force_reprocess)
+        file_menu.add_command(label="اعمال لیست اصلاحات جدید...", command=self._choose_correction_list)
         file_menu.add_separator()
-        file_menu.add_command(label="خروجی نتایج به اکسل", command=self._export_results_to_excel)
-        file_menu.add_command(label="خروجی جملات منبع به اکسل", command=self._export_source_sentences_to_excel)
+        file_menu.add_command(label="خروجی نتایج (اکسل/CSV/Parquet)", command=self._export_results)
+        file_menu.add_command(label="خروجی جملات منبع (اکسل/CSV/Parquet)", command=self._export_source_sentences)
+        file_menu.add_command(label="خروجی همه نتایج با جملات منبع", command=self._export_concordance)
+        file_menu.add_command(label="خروجی KWIC رخدادهای ردیف انتخاب‌شده", command=self._export_kwic)
         menubar.add_cascade(label="فایل", menu=file_menu)
 
+        self.active_corpus_var = tk.StringVar(value=self.active_corpus_name)
+        self.search_corpora_vars = {}
+        self.corpus_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="مجموعه‌ها", menu=self.corpus_menu)
+        self._rebuild_corpus_menu()
+
         font_menu = tk.Menu(menubar, tearoff=0)
         font_families = ["Tahoma", "Arial", "Times New Roman", "Courier New", "Dubai"]
         font_sizes = [9, 10, 11, 12, 13, 14, 16, 18, 20, 22]
@@ -324,9 +2099,14 @@ class TextAnalyzerApp:
         search_type = self.search_type_var.get()
         if search_type == "کلمات مجاور":
             self.collocation_tools_frame.pack(side=tk.RIGHT, before=self.keyword_entry, padx=(5, 5), pady=5,
-                                                   fill=tk.NONE, expand=False)
+                                              fill=tk.NONE, expand=False)
         else:
             self.collocation_tools_frame.pack_forget()
+        if search_type == "کشف هم‌نشین‌ها":
+            self.discovery_tools_frame.pack(side=tk.RIGHT, before=self.keyword_entry, padx=(5, 5), pady=5,
+                                            fill=tk.NONE, expand=False)
+        else:
+            self.discovery_tools_frame.pack_forget()
 
     def _show_help(self):
         try:
@@ -369,165 +2149,241 @@ class TextAnalyzerApp:
         position_type = values[4]
 
         self.current_found_word = None
+        self.current_dispersion = None
         sources_to_display = []
-
-        if 'direct_hit' in item_tags:
+        source_refs = []
+
+        lazy_key = ("عبارت کلیدی", term_in_table) if 'direct_hit' in item_tags else \
+            (position_type, term_in_table) if 'collocation_hit' in item_tags else None
+        if lazy_key is not None and self._resolve_lazy_sources(lazy_key, self._on_result_click):
+            # پس از پیدا شدن رخدادها، ردیف انتخاب‌شده دوباره نمایش داده می‌شود
+            sources_to_display = [("در حال یافتن جملات منبع...", "", None, ())]
+        elif 'direct_hit' in item_tags:
             self.current_found_word = term_in_table
             key_for_sources = term_in_table
-            unique_sources = set(self.direct_phrase_sources.get(key_for_sources, []))
+            self.current_dispersion = self.dispersion.get(("عبارت کلیدی", term_in_table))
+            source_refs = self.direct_phrase_sources.get(key_for_sources, [])
+            unique_sources = self._resolve_sources(source_refs)
             if not unique_sources:
-                sources_to_display = [("جمله‌ای برای عبارت کلیدی یافت نشد.", "")]
+                sources_to_display = [("جمله‌ای برای عبارت کلیدی یافت نشد.", "", None, ())]
             else:
-                sources_to_display = sorted(list(unique_sources), key=lambda x: (x[1] is None, x[1], x[0]))
+                sources_to_display = sorted(unique_sources, key=lambda x: (x[1] is None, x[1], x[0]))
         elif 'substring_hit' in item_tags:
             self.current_found_word = term_in_table
             key_for_sources = term_in_table
-            unique_sources = set(self.direct_phrase_sources.get(key_for_sources, []))
+            self.current_dispersion = self.dispersion.get(("تطابق جزئی", term_in_table))
+            source_refs = self.direct_phrase_sources.get(key_for_sources, [])
+            unique_sources = self._resolve_sources(source_refs)
             if not unique_sources:
-                sources_to_display = [("جمله‌ای برای این کلمه یافت نشد.", "")]
+                sources_to_display = [("جمله‌ای برای این کلمه یافت نشد.", "", None, ())]
             else:
-                sources_to_display = sorted(list(unique_sources), key=lambda x: (x[1] is None, x[1], x[0]))
+                sources_to_display = sorted(unique_sources, key=lambda x: (x[1] is None, x[1], x[0]))
         elif 'collocation_hit' in item_tags:
             self.current_found_word = term_in_table
             key_for_mapping = (position_type, term_in_table)
-            unique_sources = set(self.sentence_mapping.get(key_for_mapping, []))
+            self.current_dispersion = self.dispersion.get(key_for_mapping)
+            source_refs = self.sentence_mapping.get(key_for_mapping, [])
+            unique_sources = self._resolve_sources(source_refs)
             if not unique_sources:
-                sources_to_display = [("جمله‌ای برای این کلمه هم‌نشین یافت نشد.", "")]
+                sources_to_display = [("جمله‌ای برای این کلمه هم‌نشین یافت نشد.", "", None, ())]
             else:
-                sources_to_display = sorted(list(unique_sources), key=lambda x: (x[1] is None, x[1], x[0]))
+                sources_to_display = sorted(unique_sources, key=lambda x: (x[1] is None, x[1], x[0]))
         else:
-            sources_to_display = [("نوع نتیجه نامشخص است.", "")]
+            sources_to_display = [("نوع نتیجه نامشخص است.", "", None, ())]
 
         self.current_source_sentences_for_export = sources_to_display
+        # رخدادها به ترتیب متن، برای نمایش و خروجی KWIC
+        self.current_source_hits = sorted(set(source_refs))
         self._apply_or_remove_highlights()
 
+    def _format_dispersion(self, book_counts: Counter, max_books: int = 15) -> str:
+        """توزیع فراوانی یک نتیجه در کتاب‌ها (پراکندگی) را به صورت یک خط خلاصه نمایش می‌دهد."""
+        multi_corpus = len({corpus_name for corpus_name, _ in book_counts}) > 1
+        parts = []
+        for (corpus_name, book_path), count in book_counts.most_common(max_books):
+            book_name = Path(book_path).name
+            parts.append(f"{corpus_name}/{book_name} ({count})" if multi_corpus else f"{book_name} ({count})")
+        text = f"پراکندگی در {len(book_counts)} کتاب: " + "، ".join(parts)
+        if len(book_counts) > max_books:
+            text += f"، و {len(book_counts) - max_books} کتاب دیگر"
+        return text
+
+    def _resolve_sources(self, source_refs) -> list:
+        """
+        ارجاع‌های (مجموعه، بخش، توکن شروع، توکن پایان) را به (جمله، مسیر کتاب، مجموعه، بازه‌های هایلایت)
+        تبدیل می‌کند. رخدادهای یک جمله یکی شده و بازه‌های نویسه‌ای آن‌ها از لایه مکان توکن‌ها خوانده می‌شود.
+        """
+        spans_by_sentence = defaultdict(set)
+        for corpus_name, seg, token_lo, token_hi in set(source_refs):
+            corpus = self.corpora[corpus_name]
+            start, end = corpus.char_span(token_lo, token_hi)
+            key = (corpus.sentence(seg), corpus.book_path(seg), corpus_name)
+            if end > start:
+                spans_by_sentence[key].add((start, end))
+            else:
+                spans_by_sentence[key]
+        resolved = []
+        for key, spans in spans_by_sentence.items():
+            merged = []
+            for start, end in sorted(spans):
+                if merged and start <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                else:
+                    merged.append((start, end))
+            resolved.append(key + (tuple(merged),))
+        return resolved
+
     # *** MODIFIED ***: تابع بازچینی برای استفاده از مدل معکوس کامل و تضمین فاصله
-    def _reorder_text_for_bidi_fix(self, text, phrase_to_highlight, model):
+    def _reorder_text_for_bidi_fix(self, text, spans, model):
         """
         بخش‌های متن را بر اساس مدل انتخابی برای مقابله با باگ رندرینگ bidi بازچینی می‌کند.
+        spans بازه‌های هایلایت (جداکننده‌ها) است و متن جدید همراه با بازه‌های جابه‌جاشده برگردانده می‌شود.
         """
-        if not phrase_to_highlight or phrase_to_highlight not in text:
-            return text
-
-        try:
-            parts = re.split(f'({re.escape(phrase_to_highlight)})', text, flags=re.IGNORECASE)
-            text_segments = parts[::2]
-            delimiters = parts[1::2]
+        if not spans:
+            return text, spans
 
-            reordered_segments = []
+        bounds = [0] + [position for span in spans for position in span] + [len(text)]
+        text_segments = [text[bounds[k]:bounds[k + 1]] for k in range(0, len(bounds), 2)]
+        delimiters = [text[start:end] for start, end in spans]
 
-            if model == "مدل ۱ (عادی)":
-                reordered_segments = text_segments
+        reordered_segments = []
 
-            elif model == "مدل ۲ (معکوس کامل)":
-                reordered_segments = list(reversed(text_segments))
+        if model == "مدل ۱ (عادی)":
+            reordered_segments = text_segments
 
-            elif model == "مدل ۳ (جفت آخر عادی)":
-                segments = list(text_segments)
-                if len(segments) >= 2:
-                    last_pair = segments[-2:]
-                    other_segments = segments[:-2]
-                    reordered_segments = list(reversed(other_segments)) + last_pair
-                else:
-                    reordered_segments = segments
-
-            elif model == "مدل ۴ (جفت اول عادی)":
-                segments = list(text_segments)
-                if len(segments) >= 2:
-                    first_pair = segments[:2]
-                    other_segments = segments[2:]
-                    reordered_segments = first_pair + list(reversed(other_segments))
-                else:
-                    reordered_segments = segments
+        elif model == "مدل ۲ (معکوس کامل)":
+            reordered_segments = list(reversed(text_segments))
 
-            # بازسازی رشته نهایی با تضمین وجود فاصله در اطراف جداکننده
-            final_text_parts = []
-            for i, segment in enumerate(reordered_segments):
-                final_text_parts.append(segment.strip())
-                if i < len(delimiters):
-                    final_text_parts.append(f" {delimiters[i]} ")
+        elif model == "مدل ۳ (جفت آخر عادی)":
+            segments = list(text_segments)
+            if len(segments) >= 2:
+                last_pair = segments[-2:]
+                other_segments = segments[:-2]
+                reordered_segments = list(reversed(other_segments)) + last_pair
+            else:
+                reordered_segments = segments
+
+        elif model == "مدل ۴ (جفت اول عادی)":
+            segments = list(text_segments)
+            if len(segments) >= 2:
+                first_pair = segments[:2]
+                other_segments = segments[2:]
+                reordered_segments = first_pair + list(reversed(other_segments))
+            else:
+                reordered_segments = segments
 
-            return "".join(final_text_parts)
+        # بازسازی رشته نهایی با تضمین وجود فاصله در اطراف جداکننده
+        final_text, new_spans = "", []
+        for i, segment in enumerate(reordered_segments):
+            final_text += segment.strip()
+            if i < len(delimiters):
+                final_text += " "
+                new_spans.append((len(final_text), len(final_text) + len(delimiters[i])))
+                final_text += delimiters[i] + " "
 
-        except (re.error, IndexError):
-            return text
+        return final_text, new_spans
 
     def _apply_or_remove_highlights(self):
+        """پنل جملات منبع را از نو می‌سازد؛ فقط صفحه اول درج و بقیه هنگام پیمایش اضافه می‌شوند."""
         self.source_text.config(state=tk.NORMAL)
         self.source_text.delete(1.0, tk.END)
+        self.source_rendered_count = 0
+        self.source_link_targets.clear()
 
-        highlight_model = self.highlight_model_var.get()
+        if self.current_dispersion:
+            self.source_text.insert(tk.END, self._format_dispersion(self.current_dispersion) + "\n\n",
+                                    ("rtl_align", "dispersion_info"))
+        self.source_text.config(state=tk.DISABLED)
+        self._render_source_page()
 
-        for i, (original_sentence, book_path) in enumerate(self.current_source_sentences_for_export):
-            if i > 0:
-                self.source_text.insert(tk.END, "\n\n---\n\n", "rtl_align")
+    def _source_pane_items(self) -> list:
+        return self.current_source_hits if self.kwic_view_var.get() else self.current_source_sentences_for_export
 
-            is_special_message = original_sentence.startswith("جمله‌ای") or original_sentence == "نوع نتیجه نامشخص است."
-            if is_special_message:
-                self.source_text.insert(tk.END, f"{original_sentence}\n", "rtl_align")
-                continue
+    def _render_source_page(self):
+        """صفحه بعدی جملات منبع (یا سطرهای KWIC) را با یک فراخوانی insert به انتهای پنل اضافه می‌کند."""
+        self._source_page_pending = False
+        sources = self._source_pane_items()
+        first = self.source_rendered_count
+        if first >= len(sources):
+            return
+        page = sources[first:first + self.SOURCE_PAGE_SIZE]
+        highlight_model = self.highlight_model_var.get()
+        highlight = highlight_model != "بدون هایلایت"
 
-            if book_path:
-                file_info_start_idx = self.source_text.index(tk.INSERT)
-                book_name_ext = f"{Path(book_path).name}.docx"
-
-                if hasattr(self, 'root_folder_path') and self.root_folder_path:
-                    full_b_path = self.root_folder_path / f"{book_path}.docx"
-                    tag_name = f"book_link_{i}"
-                    file_info_display = f"({book_name_ext})\n"
-
-                    self.source_text.insert(tk.INSERT, file_info_display, ("rtl_align", tag_name))
-                    end_idx_file_link = self.source_text.index(f"{tk.INSERT}-1c")
-                    self.source_text.tag_add(tag_name, file_info_start_idx, end_idx_file_link)
-                    self.source_text.tag_config(tag_name, foreground="darkblue", underline=True)
-                    self.source_text.tag_bind(tag_name, "<Button-1>",
-                                              lambda e, p=str(full_b_path): self._open_file(Path(p)))
+        self.source_text.config(state=tk.NORMAL)
+        more_range = self.source_text.tag_ranges("load_more")
+        if more_range:
+            self.source_text.delete(*more_range)
+        # قطعه‌های متن و تگ‌های آن‌ها در پایتون ساخته می‌شوند (بدون جستجوی Tk روی کل ویجت)
+        chunks = []
+        line = int(self.source_text.index("end-1c").split('.')[0])
+
+        def emit(text, tags=("rtl_align",)):
+            nonlocal line
+            chunks.extend((text, tags))
+            line += text.count("\n")
+
+        if self.kwic_view_var.get():
+            # هر رخداد یک سطر: بافت پیشین | کلیدواژه | بافت پسین
+            for i, (corpus_name, seg, token_lo, token_hi) in enumerate(page, start=first):
+                left, keyword, right = self.corpora[corpus_name].kwic(seg, token_lo, token_hi, self.KWIC_WIDTH)
+                emit(("\n" if i > 0 else "") + f"{left} | ")
+                emit(keyword, ("rtl_align", "highlight_found") if highlight else ("rtl_align",))
+                emit(f" | {right}")
+        else:
+            for i, (original_sentence, book_path, corpus_name, spans) in enumerate(page, start=first):
+                if i > 0:
+                    emit("\n\n---\n\n")
+
+                is_special_message = original_sentence.startswith("جمله‌ای") or original_sentence == "نوع نتیجه نامشخص است."
+                if is_special_message:
+                    emit(f"{original_sentence}\n")
+                    continue
+
+                if book_path:
+                    book_name_ext = f"{Path(book_path).name}.docx"
+                    corpus_root = self._corpus_root(corpus_name)
+                    if corpus_root:
+                        self.source_link_targets[line] = corpus_root / f"{book_path}.docx"
+                        emit(f"({book_name_ext})", ("rtl_align", "book_link"))
+                        emit("\n")
+                    else:
+                        emit(f"({book_name_ext}) (مسیر فایل در دسترس نیست)\n")
+
+                sentence_to_display = original_sentence
+                if highlight:
+                    sentence_to_display, spans = self._reorder_text_for_bidi_fix(original_sentence, spans,
+                                                                                 highlight_model)
                 else:
-                    self.source_text.insert(tk.END, f"({book_name_ext}) (مسیر فایل در دسترس نیست)\n", "rtl_align")
-
-            sentence_to_display = original_sentence
-            if highlight_model != "بدون هایلایت" and self.current_found_word:
-                sentence_to_display = self._reorder_text_for_bidi_fix(original_sentence, self.current_found_word, highlight_model)
-
-            self.source_text.insert(tk.END, sentence_to_display, "rtl_align")
-
-        self.source_text.tag_remove("highlight_found", "1.0", tk.END)
-        if highlight_model != "بدون هایلایت":
-            self._highlight_text_in_range(
-                text_widget=self.source_text,
-                phrase=self.current_found_word,
-                tag="highlight_found",
-                start_range="1.0",
-                end_range=tk.END
-            )
-
+                    spans = ()
+                position = 0
+                for span_start, span_end in spans:
+                    emit(sentence_to_display[position:span_start])
+                    emit(sentence_to_display[span_start:span_end], ("rtl_align", "highlight_found"))
+                    position = span_end
+                emit(sentence_to_display[position:])
+
+        self.source_rendered_count = first + len(page)
+        remaining = len(sources) - self.source_rendered_count
+        if remaining > 0:
+            emit("\n\n", ("rtl_align", "load_more"))
+            emit(f"نمایش {min(remaining, self.SOURCE_PAGE_SIZE)} مورد بعدی "
+                 f"({self.source_rendered_count} از {len(sources)})", ("rtl_align", "load_more"))
+        self.source_text.insert(tk.END, *chunks)
         self.source_text.config(state=tk.DISABLED)
 
-    def _highlight_text_in_range(self, text_widget, phrase, tag, start_range, end_range):
-        if not phrase: return
-        current_pos = start_range
-        while True:
-            pos = text_widget.search(phrase, current_pos, stopindex=end_range, nocase=True, regexp=False, elide=False)
-            if not pos:
-                break
+    def _on_source_scroll(self, first, last):
+        self.source_text.vbar.set(first, last)
+        if float(last) >= 1.0 and not self._source_page_pending and \
+                self.source_rendered_count < len(self._source_pane_items()):
+            self._source_page_pending = True
+            self.root.after_idle(self._render_source_page)
 
-            end_idx_highlight_str = f"{pos}+{len(phrase)}c"
-            actual_end_idx_highlight = text_widget.index(end_idx_highlight_str)
-
-            is_start_boundary = (pos == "1.0" or not text_widget.get(f"{pos}-1c", pos).isalnum())
-
-            is_end_boundary = True
-            try:
-                next_char = text_widget.get(actual_end_idx_highlight, f"{actual_end_idx_highlight}+1c")
-                if next_char.isalnum():
-                    is_end_boundary = False
-            except tk.TclError:
-                pass
-
-            if is_start_boundary and is_end_boundary:
-                text_widget.tag_add(tag, pos, actual_end_idx_highlight)
-
-            current_pos = actual_end_idx_highlight
+    def _on_book_link_click(self, event):
+        line = int(self.source_text.index(f"@{event.x},{event.y}").split('.')[0])
+        target = self.source_link_targets.get(line)
+        if target:
+            self._open_file(target)
 
     def _open_file(self, file_path: Path):
         try:
@@ -538,81 +2394,255 @@ class TextAnalyzerApp:
         except Exception as e:
             messagebox.showerror("خطا در باز کردن فایل", f"امکان باز کردن فایل وجود نداشت:\n{e}")
 
-    def _export_results_to_excel(self):
-        if not self.results_tree.get_children():
-            messagebox.showinfo("خالی از نتیجه", "هیچ نتیجه‌ای برای خروجی گرفتن وجود ندارد.")
+    def _resolve_lazy_sources(self, key, on_done) -> bool:
+        """
+        ارجاع‌های ردیفی که رخدادهایش هنگام جستجو نگه داشته نشده‌اند را در یک رشته پس‌زمینه پیدا می‌کند (ممکن
+        است یک شمارش کامل لازم باشد) و پس از ثبت آن‌ها on_done را در رشته رابط صدا می‌زند. اگر ارجاع‌ها
+        از قبل موجود باشند False برمی‌گرداند.
+        """
+        resolve = self.lazy_sources.get(key)
+        if resolve is None:
+            return False
+        if self.resolving_sources.get(key) is not resolve:
+            self.resolving_sources[key] = resolve
+
+            def worker():
+                try:
+                    refs = resolve()
+                except Exception as e:
+                    traceback.print_exc()
+                    refs = e
+                self.root.after(0, self._store_lazy_sources, key, resolve, refs, on_done)
+
+            threading.Thread(target=worker, daemon=True).start()
+        self._update_status("در حال یافتن جملات منبع...")
+        return True
+
+    def _store_lazy_sources(self, key, resolve, refs, on_done):
+        """
+        ارجاع‌های پیداشده را ثبت می‌کند؛ پراکندگی هم اگر هنگام جستجو شمرده نشده باشد (ردیف‌های «کشف») از
+        همین ارجاع‌ها ساخته می‌شود. نتیجه جستجویی که از آن پس جایگزین شده است کنار گذاشته می‌شود.
+        """
+        if self.resolving_sources.get(key) is resolve:
+            del self.resolving_sources[key]
+        if self.lazy_sources.get(key) is not resolve:
             return
+        if isinstance(refs, Exception):
+            self._update_status("خطا در یافتن جملات منبع.")
+            messagebox.showerror("خطای پیش‌بینی نشده", f"خطایی رخ داد:\n\n{refs}")
+            return
+        del self.lazy_sources[key]
+        self._update_status("جملات منبع پیدا شد.")
+        if key not in self.dispersion:
+            for corpus_name, seg, _, _ in refs:
+                self.dispersion[key][(corpus_name, self.corpora[corpus_name].book_path(seg))] += 1
+        if key[0] == "عبارت کلیدی":
+            self.direct_phrase_sources[key[1]].extend(refs)
+        else:
+            self.sentence_mapping[key].extend(refs)
+        on_done()
+
+    def _ngram_sources(self, corpus_name: str, compiled: list[tuple], tag_ids) -> list[tuple]:
+        corpus = self.corpora[corpus_name]
+        return [(corpus_name, seg, start, end) for seg, start, end in match_query(corpus, compiled)
+                if tag_ids is None or tuple(corpus.pos[start:end]) == tag_ids]
 
+    def _row_source_refs(self, row):
+        """
+        ارجاع‌های (مجموعه، بخش) منبع یک ردیف از مدل نتایج؛ برای ردیفی که رخدادهایش هنوز پیدا نشده، تابعی
+        که آن‌ها را برمی‌گرداند (تا در رشته خروجی صدا زده شود).
+        """
+        if row[4] == "تطابق جزئی":
+            return self.direct_phrase_sources.get(row[1], [])
+        resolve = self.lazy_sources.get((row[4], row[1]))
+        if resolve is not None:
+            return resolve
+        if row[4] == "عبارت کلیدی":
+            return self.direct_phrase_sources.get(row[1], [])
+        return self.sentence_mapping.get((row[4], row[1]), [])
+
+    def _ask_export_path(self, suffix: str, title: str) -> str:
         default_filename = ""
         if self.last_search_phrase:
             safe_phrase = re.sub(r'[\\/*?:"<>|]', "", self.last_search_phrase)
-            default_filename = f"{safe_phrase}_نتایج.xlsx"
+            default_filename = f"{safe_phrase}_{suffix}.xlsx"
+        return filedialog.asksaveasfilename(initialfile=default_filename, defaultextension=".xlsx",
+                                            filetypes=EXPORT_FILETYPES, title=title)
 
-        file_path = filedialog.asksaveasfilename(
-            initialfile=default_filename,
-            defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
-            title="ذخیره نتایج جستجو در فایل اکسل"
-        )
+    def _export_results(self):
+        if not self.current_results:
+            messagebox.showinfo("خالی از نتیجه", "هیچ نتیجه‌ای برای خروجی گرفتن وجود ندارد.")
+            return
+        file_path = self._ask_export_path("نتایج", "ذخیره نتایج جستجو")
         if not file_path: return
-        try:
-            data = []
-            cols = ("نمونه", "کلمه", "نقش دستوری", "فراوانی", "موقعیت")
-            for item_id in self.results_tree.get_children():
-                values = self.results_tree.item(item_id, "values")
-                if values and len(values) == len(cols) and values[1] != "هیچ نتیجه‌ای یافت نشد.":
-                    data.append(dict(zip(cols, values)))
-            if not data: messagebox.showinfo("خالی از نتیجه", "هیچ نتیجه معتبری برای خروجی گرفتن وجود ندارد."); return
-            df = pd.DataFrame(data)
-            df.to_excel(file_path, index=False, engine='openpyxl')
-            messagebox.showinfo("موفقیت", f"نتایج با موفقیت در فایل زیر ذخیره شد:\n{file_path}")
-        except Exception as e:
-            messagebox.showerror("خطا در ذخیره‌سازی", f"خطایی در هنگام ذخیره فایل اکسل رخ داد:\n{e}")
-
-    def _export_source_sentences_to_excel(self):
-        if not self.current_source_sentences_for_export or \
-                (len(self.current_source_sentences_for_export) == 1 and self.current_source_sentences_for_export[0][
-                    0].startswith("جمله‌ای")):
+        cols = ("نمونه", "کلمه", "نقش دستوری", "فراوانی", "موقعیت", "مجموعه‌ها", "پراکندگی")
+        self._start_export_job(file_path, cols, list(self.current_results), len(self.current_results))
+
+    def _export_source_sentences(self):
+        rows = [(sentence, f"{Path(book_path).name}.docx" if book_path else "", corpus_name)
+                for sentence, book_path, corpus_name, _ in self.current_source_sentences_for_export
+                if corpus_name is not None]
+        if not rows:
             messagebox.showinfo("خالی از نتیجه", "هیچ جمله منبعی برای خروجی گرفتن وجود ندارد.")
             return
+        file_path = self._ask_export_path("جملات_منبع", "ذخیره جملات منبع")
+        if not file_path: return
+        self._start_export_job(file_path, ("جمله منبع", "نام فایل", "مجموعه"), rows, len(rows))
 
-        default_filename = ""
-        search_keyword = self.last_search_phrase
-        if search_keyword:
-            safe_phrase = re.sub(r'[\\/*?:"<>|]', "", search_keyword)
-            default_filename = f"{safe_phrase}_جملات_منبع.xlsx"
-
-        file_path = filedialog.asksaveasfilename(
-            initialfile=default_filename,
-            defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
-            title="ذخیره جملات منبع در فایل اکسل"
-        )
+    def _export_kwic(self):
+        """رخدادهای ردیف انتخاب‌شده را به صورت KWIC (هر رخداد یک ردیف) می‌نویسد."""
+        if not self.current_source_hits:
+            messagebox.showinfo("خالی از نتیجه", "هیچ رخدادی برای خروجی گرفتن وجود ندارد.")
+            return
+        file_path = self._ask_export_path("KWIC", "ذخیره رخدادها به صورت KWIC")
         if not file_path: return
-        try:
-            data_to_export = []
-            for sentence, book_relative_path_no_ext in self.current_source_sentences_for_export:
-                if sentence.startswith("جمله‌ای"): continue
-                book_name = f"{Path(book_relative_path_no_ext).name}.docx" if book_relative_path_no_ext else ""
-                data_to_export.append({"جمله منبع": sentence, "نام فایل": book_name})
-            if not data_to_export: messagebox.showinfo("خالی از نتیجه",
-                                                       "هیچ جمله منبع معتبری برای خروجی گرفتن وجود ندارد."); return
-            df = pd.DataFrame(data_to_export)
-            df.to_excel(file_path, index=False, engine='openpyxl')
-            messagebox.showinfo("موفقیت", f"جملات منبع با موفقیت در فایل زیر ذخیره شدند:\n{file_path}")
-        except Exception as e:
-            messagebox.showerror("خطا در ذخیره‌سازی", f"خطایی در هنگام ذخیره فایل اکسل رخ داد:\n{e}")
+        hits, corpora, width = list(self.current_source_hits), dict(self.corpora), self.KWIC_WIDTH
+
+        def rows():
+            for corpus_name, seg, token_lo, token_hi in hits:
+                corpus = corpora[corpus_name]
+                yield corpus.kwic(seg, token_lo, token_hi, width) + (
+                    f"{Path(corpus.book_path(seg)).name}.docx", corpus_name)
+
+        cols = ("بافت پیشین", "کلیدواژه", "بافت پسین", "نام فایل", "مجموعه")
+        self._start_export_job(file_path, cols, rows(), len(hits))
+
+    def _export_concordance(self):
+        """همه نتایج را همراه با تمام جملات منبع و کتاب‌هایشان در یک فایل می‌نویسد."""
+        if not self.current_results:
+            messagebox.showinfo("خالی از نتیجه", "هیچ نتیجه‌ای برای خروجی گرفتن وجود ندارد.")
+            return
+        file_path = self._ask_export_path("همه_جملات", "ذخیره همه نتایج و جملات منبع")
+        if not file_path: return
+        # ارجاع‌ها همین‌جا گرفته می‌شوند تا جستجوی بعدی روی خروجی در حال نوشتن اثر نگذارد؛ ردیف‌هایی که
+        # رخدادهایشان هنوز پیدا نشده در خود رشته خروجی پیدا می‌شوند
+        snapshot = [(row, self._row_source_refs(row)) for row in self.current_results]
+        corpora, width = dict(self.corpora), self.KWIC_WIDTH
+
+        def rows():
+            for row, refs in snapshot:
+                if callable(refs):
+                    refs = refs()
+                for corpus_name, seg, token_lo, token_hi in dict.fromkeys(refs):
+                    corpus = corpora[corpus_name]
+                    book_path = corpus.book_path(seg)
+                    yield (row[1], row[2], row[4], row[3], corpus_name,
+                           f"{Path(book_path).name}.docx" if book_path else "",
+                           *corpus.kwic(seg, token_lo, token_hi, width), corpus.sentence(seg))
+
+        cols = ("کلمه", "نقش دستوری", "موقعیت", "فراوانی", "مجموعه", "نام فایل",
+                "بافت پیشین", "کلیدواژه", "بافت پسین", "جمله منبع")
+        # برای ردیف‌های پیدانشده، فراوانی ردیف برآورد تعداد رخدادها در نوار پیشرفت است
+        total = sum(int(row[3]) if callable(refs) else len(refs) for row, refs in snapshot)
+        self._start_export_job(file_path, cols, rows(), total)
+
+    def _start_export_job(self, file_path, columns, rows, total):
+        if self.export_thread is not None and self.export_thread.is_alive():
+            messagebox.showinfo("خروجی در حال اجرا", "یک خروجی دیگر در حال نوشتن است.")
+            return
+        self.export_cancel_event.clear()
+        self.progressbar.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 2))
+        self.progressbar['value'] = 0
+        self.export_cancel_button.pack(side=tk.RIGHT, padx=(0, 5), pady=2)
+
+        def progress(count):
+            self.root.after(0, self._update_progress, count / max(total, 1) * 100,
+                            f"در حال نوشتن خروجی: {count} از {total} ردیف")
+
+        def worker():
+            try:
+                count = write_table(file_path, columns, rows, progress, self.export_cancel_event)
+                self.root.after(0, self._finish_export, f"{count} ردیف در فایل زیر ذخیره شد:\n{file_path}", None)
+            except ExportCancelled:
+                self.root.after(0, self._finish_export, None, None)
+            except Exception as e:
+                traceback.print_exc()
+                self.root.after(0, self._finish_export, None, e)
+
+        self.export_thread = threading.Thread(target=worker, daemon=True)
+        self.export_thread.start()
+
+    def _finish_export(self, message, error):
+        self.progressbar.pack_forget()
+        self.export_cancel_button.pack_forget()
+        if error is not None:
+            self._update_status("خطا در ذخیره خروجی.")
+            messagebox.showerror("خطا در ذخیره‌سازی", f"خطایی در هنگام ذخیره فایل رخ داد:\n{error}")
+        elif message is None:
+            self._update_status("خروجی لغو شد.")
+        else:
+            self._update_status("خروجی با موفقیت ذخیره شد.")
+            messagebox.showinfo("موفقیت", message)
+
+    def _ensure_normalizer(self):
+        """نرمال‌ساز hazm را در اولین استفاده می‌سازد (وارد کردن hazm زمان‌بر است)."""
+        with self._hazm_lock:
+            if self.normalizer is None:
+                from hazm import Normalizer
+                self.normalizer = Normalizer()
+        return self.normalizer
+
+    def _lemmatize(self, word: str, tag: str) -> str:
+        """بن یک کلمه با توجه به نقش دستوری آن (Lemmatizer هازم در اولین استفاده ساخته می‌شود)."""
+        if self.lemmatizer is None:
+            with self._hazm_lock:
+                if self.lemmatizer is None:
+                    from hazm import Lemmatizer
+                    self.lemmatizer = Lemmatizer()
+        return self.lemmatizer.lemmatize(word, HAZM_LEMMA_POS.get(tag, ""))
+
+    def _get_pos_tagger(self):
+        """مدل برچسب‌گذار دستوری را فقط هنگام نیاز (پردازش یا برچسب‌گذاری) بارگذاری می‌کند."""
+        with self._hazm_lock:
+            if self.pos_tagger is None:
+                if not os.path.exists(self.model_path):
+                    raise FileNotFoundError("فایل 'pos_tagger.model' در کنار برنامه یافت نشد.")
+                from hazm import POSTagger
+                self.pos_tagger = POSTagger(model=self.model_path)
+        return self.pos_tagger
+
+    def _tag_text(self, text: str) -> list[tuple[str, str]]:
+        from hazm import word_tokenize
+        return self._get_pos_tagger().tag(word_tokenize(text))
+
+    def _open_tag_cache(self) -> TagCache:
+        """کش برچسب‌گذاری مشترک همه مجموعه‌ها؛ کلیدها به نسخه hazm و فایل مدل وابسته‌اند."""
+        return TagCache(os.path.join(self.script_dir, 'tagging_cache.sqlite'),
+                        f"{get_hazm_version()}|{file_fingerprint(self.model_path)}")
+
+    def _preload_pos_tagger(self):
+        """بارگذاری مدل را در پس‌زمینه آغاز می‌کند تا هنگام برچسب‌گذاری آماده باشد."""
+        def worker():
+            try:
+                self._get_pos_tagger()
+            except Exception:
+                # خطا هنگام استفاده واقعی از مدل دوباره رخ داده و به کاربر نمایش داده می‌شود
+                traceback.print_exc()
+        threading.Thread(target=worker, daemon=True).start()
 
     def _prepare_for_loading(self):
+        # هر بارگذاری ممکن است کش را بازنویسی کند؛ ارجاع‌های تنبل و پردازه‌های جستجو پیکره‌ها را باز نگه می‌دارند
+        self._shutdown_search_pool()
+        self.loading = True
+        self.lazy_sources.clear()
+        self.exact_count_params = None
+        self.exact_count_button.pack_forget()
         self.search_button.config(state=tk.DISABLED);
         self.progressbar.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 2));
         self.progressbar['value'] = 0
 
-    def _initiate_loading_process(self):
+    def _initiate_loading_process(self, demote: str | None = None):
+        """demote: مجموعه‌ای که تازه غیرفعال شده و در رشته بارگذاری به mmap منتقل می‌شود."""
         self._prepare_for_loading()
-        if os.path.exists(self.cache_path):
+        if os.path.exists(self.cache_path) or self._has_legacy_cache():
             self._update_status("فایل کش یافت شد. در حال بارگذاری...");
-            threading.Thread(target=self._load_from_cache, daemon=True).start()
+            threading.Thread(target=self._load_from_cache, args=(demote,), daemon=True).start()
         else:
+            if demote:
+                self.corpora.pop(demote, None)  # در صورت نیاز، در اولین جستجو با mmap باز می‌شود
             self._update_status("فایل کش یافت نشد. لطفاً منابع را برای پردازش اولیه انتخاب کنید.")
+            # مدل برچسب‌گذار در حین انتخاب پوشه‌ها در پس‌زمینه بارگذاری می‌شود
+            self._preload_pos_tagger()
             root_folder_path_str = filedialog.askdirectory(title="پوشه اصلی حاوی کتاب‌ها را انتخاب کنید")
             if not root_folder_path_str:
                 self._enable_ui_after_load("عملیات لغو شد.")
@@ -626,31 +2656,239 @@ class TextAnalyzerApp:
                              args=(self.root_folder_path, Path(correction_path_str) if correction_path_str else None),
                              daemon=True).start()
 
-    def _load_from_cache(self):
+    def _has_legacy_cache(self) -> bool:
+        """کش قدیمی pickle فقط به مجموعه پیش‌فرض تعلق دارد."""
+        return self.active_corpus_name == CorpusRegistry.DEFAULT_NAME and os.path.exists(self.legacy_cache_path)
+
+    def _load_from_cache(self, demote: str | None = None):
         try:
-            with open(self.cache_path, 'rb') as f:
-                cache_content = pickle.load(f)
-                if isinstance(cache_content, tuple) and len(cache_content) == 2 and isinstance(cache_content[1], Path):
-                    self.tagged_data, self.root_folder_path = cache_content
-                else:
-                    self.tagged_data = cache_content
-                    self.root_folder_path = None
-                    self.root.after(100, lambda: messagebox.showwarning("فایل کش قدیمی",
-                                                                        "فایل کش شما قدیمی است و مسیر پوشه اصلی کتاب‌ها را ندارد. "
-                                                                        "برای فعال شدن قابلیت کلیک روی نام فایل، "
-                                                                        "لطفاً داده‌ها را با استفاده از منوی فایل و گزینه 'پردازش مجدد داده‌ها' دوباره پردازش کنید."))
-            self.root.after(0, self._enable_ui_after_load,
-                            f"داده‌ها با موفقیت از کش بارگذاری شد ({len(self.tagged_data)} ردیف).")
+            if demote:
+                self._demote_corpus(demote)
+            self._ensure_normalizer()
+            if not os.path.exists(self.cache_path):
+                self.root.after(0, self._update_status, "در حال تبدیل فایل کش قدیمی (pickle) به قالب جدید...")
+                legacy_corpus = migrate_legacy_cache(self.legacy_cache_path)
+                save_corpus_cache(legacy_corpus, self.cache_path, {"migrated_from": "pickle"}, self.CACHE_COMPRESSION)
+                # فایل pickle اصلی برای بازگشت در صورت مشکل در تبدیل نگه داشته می‌شود
+                os.replace(self.legacy_cache_path, self.legacy_cache_path + ".bak")
+            self.corpus, header = load_corpus_cache(self.cache_path)
+            if self.corpus.ensure_layers(self._lemmatize):
+                # لایه‌های تازه (مثلاً نمایه) یک بار ساخته و در کش ذخیره می‌شوند
+                self.root.after(0, self._update_status, "در حال ذخیره لایه‌های جدید نمایه در کش...")
+                save_corpus_cache(self.corpus, self.cache_path, header, header.get("compression"))
+            self.corpora[self.active_corpus_name] = self.corpus
+            self.root_folder_path = self.corpus.root_folder_path
+            load_message = f"داده‌ها با موفقیت از کش بارگذاری شد ({len(self.corpus)} ردیف)."
+            if self.root_folder_path is None:
+                self.root.after(100, lambda: messagebox.showwarning("فایل کش قدیمی",
+                                                                    "فایل کش شما قدیمی است و مسیر پوشه اصلی کتاب‌ها را ندارد. "
+                                                                    "برای فعال شدن قابلیت کلیک روی نام فایل، "
+                                                                    "لطفاً داده‌ها را با استفاده از منوی فایل و گزینه 'پردازش مجدد داده‌ها' دوباره پردازش کنید."))
+            else:
+                corrections = header.get("corrections") or {}
+                correction_path = corrections.get("path")
+                if correction_path and os.path.exists(correction_path) and \
+                        file_fingerprint(correction_path) != corrections.get("fingerprint"):
+                    # لیست اصلاحات پس از ساخت کش ویرایش شده است؛ پیش از بازنویسی کش از کاربر پرسیده می‌شود
+                    self.root.after(100, self._offer_correction_update, Path(correction_path))
+                stale_reasons = self._check_cache_header(header)
+                if stale_reasons:
+                    self.root.after(100, lambda: messagebox.showwarning(
+                        "فایل کش قدیمی", "\n".join(stale_reasons) +
+                        "\n\nبرای به‌روزرسانی، از منوی فایل گزینه 'پردازش مجدد داده‌ها' را انتخاب کنید."))
+            self.root.after(0, self._enable_ui_after_load, load_message)
         except Exception as e:
             traceback.print_exc();
             self.root.after(0, self._show_generic_error,
                             f"خطا در خواندن فایل کش: {e}. لطفاً با پردازش مجدد، آن را بازسازی کنید.")
 
+    def _cache_build_info(self, root_folder: Path, corrections: dict | None = None) -> dict:
+        """اطلاعاتی که در سرآیند کش ثبت می‌شود تا کهنه بودن کش (و تغییر لیست اصلاحات) قابل تشخیص باشد."""
+        return {
+            "hazm_version": get_hazm_version(),
+            "model_version": file_fingerprint(self.model_path),
+            "settings": {"max_words": self.MAX_WORDS, "ideal_words": self.IDEAL_WORDS},
+            "corpus_checksum": compute_corpus_checksum(root_folder),
+            "corrections": corrections,
+        }
+
+    def _check_cache_header(self, header: dict) -> list[str]:
+        """سرآیند کش را با وضعیت فعلی مقایسه کرده و دلایل کهنه بودن آن را برمی‌گرداند."""
+        if header.get("migrated_from"):
+            return []  # کش‌های تبدیل‌شده اطلاعات زمان ساخت را ندارند
+        current = self._cache_build_info(self.root_folder_path)
+        reasons = []
+        if header.get("settings") != current["settings"]:
+            reasons.append("تنظیمات تقسیم‌بندی بخش‌ها (MAX_WORDS/IDEAL_WORDS) تغییر کرده است.")
+        if header.get("hazm_version") != current["hazm_version"] or \
+                (current["model_version"] and header.get("model_version") != current["model_version"]):
+            reasons.append("نسخه hazm یا فایل مدل برچسب‌گذار تغییر کرده است.")
+        if current["corpus_checksum"] and header.get("corpus_checksum") != current["corpus_checksum"]:
+            reasons.append("فایل‌های پوشه کتاب‌ها پس از ساخت کش تغییر کرده‌اند.")
+        return reasons
+
+    # --- مدیریت مجموعه‌های نام‌دار ---
+    def _rebuild_corpus_menu(self):
+        menu = self.corpus_menu
+        menu.delete(0, tk.END)
+        menu.add_command(label="افزودن مجموعه جدید...", command=self._add_corpus)
+        menu.add_separator()
+        self.active_corpus_var.set(self.active_corpus_name)
+        for name in self.registry.names():
+            stats = self.registry.stats(name)
+            label = f"{name} ({stats['segments']} بخش، {stats['tokens']} توکن)" if stats else f"{name} (پردازش نشده)"
+            menu.add_radiobutton(label=label, variable=self.active_corpus_var, value=name,
+                                 command=lambda n=name: self._switch_corpus(n))
+        menu.add_separator()
+        search_in_menu = tk.Menu(menu, tearoff=0)
+        for name in self.registry.names():
+            var = self.search_corpora_vars.setdefault(name, tk.BooleanVar(value=False))
+            search_in_menu.add_checkbutton(label=name, variable=var)
+        menu.add_cascade(label="جستجوی هم‌زمان در مجموعه‌های دیگر", menu=search_in_menu)
+
+    def _add_corpus(self):
+        name = simpledialog.askstring("مجموعه جدید", "نام مجموعه جدید را وارد کنید:", parent=self.root)
+        if not name or not name.strip():
+            return
+        name = name.strip()
+        if name in self.registry.entries:
+            messagebox.showerror("نام تکراری", f"مجموعه‌ای با نام '{name}' از قبل وجود دارد.")
+            return
+        self.registry.add(name)
+        self._switch_corpus(name)
+
+    def _switch_corpus(self, name: str):
+        """مجموعه فعال را عوض می‌کند؛ مجموعه قبلی به جای حافظه به صورت mmap نگه داشته می‌شود."""
+        if name == self.active_corpus_name and self.corpus is not None:
+            return
+        previous_name = self.active_corpus_name
+        self.active_corpus_name = self.registry.active = name
+        self.registry.save()
+        self.active_corpus_var.set(name)
+        self.cache_path = self.registry.cache_path(name)
+        self.corpus, self.root_folder_path = None, None
+        self.results_tree.delete(*self.results_tree.get_children())
+        self.current_results = []
+        self.results_count_var.set("")
+        self.current_source_sentences_for_export, self.current_dispersion = [], None
+        self.current_source_hits = []
+        self.exact_count_params = None
+        self.exact_count_button.pack_forget()
+        self._apply_or_remove_highlights()
+        # نسخه mmap‌شده مجموعه مقصد رها می‌شود تا کش آن هنگام بارگذاری قابل بازنویسی باشد
+        self.corpora.pop(name, None)
+        self.root.title(self.base_title)
+        self._initiate_loading_process(previous_name if previous_name != name else None)
+
+    def _demote_corpus(self, name: str):
+        """
+        مجموعه غیرفعال را از حافظه خارج کرده و در صورت فشرده نبودن کش، به صورت mmap باز می‌کند.
+        کش‌های فشرده قابل mmap نیستند و هنگام نیاز دوباره بارگذاری می‌شوند. ensure_layers روی کش‌های قدیمی
+        زمان‌بر است، پس این تابع در رشته بارگذاری اجرا می‌شود، نه در رشته رابط کاربری.
+        """
+        self.corpora.pop(name, None)
+        cache_path = self.registry.cache_path(name)
+        try:
+            if read_cache_header(cache_path)[0].get("compression", "none") == "none":
+                corpus = self.corpora[name] = load_corpus_cache(cache_path, use_mmap=True)[0]
+                corpus.ensure_layers(self._lemmatize)
+        except (OSError, ValueError):
+            pass
+
+    def _search_corpora(self) -> list[tuple[str, Corpus]]:
+        """مجموعه فعال به همراه مجموعه‌های علامت‌خورده برای جستجوی هم‌زمان."""
+        search_corpora = [(self.active_corpus_name, self.corpus)]
+        for name, var in self.search_corpora_vars.items():
+            if not var.get() or name == self.active_corpus_name or name not in self.registry.entries:
+                continue
+            corpus = self.corpora.get(name)
+            if corpus is None:
+                cache_path = self.registry.cache_path(name)
+                if not os.path.exists(cache_path):
+                    continue
+                corpus = self.corpora[name] = load_corpus_cache(cache_path, use_mmap=True)[0]
+                corpus.ensure_layers(self._lemmatize)  # کش‌های قدیمی؛ لایه‌ها فقط در حافظه ساخته می‌شوند
+            search_corpora.append((name, corpus))
+        return search_corpora
+
+    def _get_search_pool(self) -> ProcessPoolExecutor:
+        """
+        مجموعه پردازه‌های ماندگار جستجو؛ در اولین جستجوی پرکار ساخته می‌شود و تا بارگذاری یا بازنویسی
+        بعدی کش (یا بستن برنامه) می‌ماند.
+        """
+        if self.search_pool is None:
+            self.search_pool = make_search_pool(SEARCH_WORKERS)
+        return self.search_pool
+
+    def _shutdown_search_pool(self):
+        """
+        پردازه‌های جستجو را می‌بندد تا نگاشت mmap آن‌ها روی فایل‌های کش آزاد شود (در ویندوز فایلی که
+        پردازه دیگری نگاشت کرده قابل جایگزینی یا حذف نیست).
+        """
+        pool, self.search_pool = self.search_pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _shareable_cache_path(self, corpus_name: str) -> str | None:
+        """
+        مسیر کش مجموعه، اگر پردازه‌های کارگر بتوانند همان داده‌های در حافظه را از آن mmap کنند: کش باید
+        فشرده نباشد و با پیکره بارگذاری‌شده (مثلاً پس از ساخت لایه‌های تازه فقط در حافظه) یکی باشد.
+        """
+        corpus = self.corpora.get(corpus_name)
+        try:
+            cache_path = self.registry.cache_path(corpus_name)
+            header = read_cache_header(cache_path)[0]
+        except (KeyError, OSError, ValueError):
+            return None
+        if corpus is None or header.get("compression", "none") != "none" or header.get("stats") != corpus.stats():
+            return None
+        return cache_path
+
+    def _ngram_path(self, corpus_name: str) -> str:
+        return os.path.splitext(self.registry.cache_path(corpus_name))[0] + ".ngrams"
+
+    def _get_ngram_tables(self, corpus_name: str, corpus: Corpus) -> NgramTables:
+        """جدول‌های n-gram مجموعه را از فایل می‌خواند و اگر نباشند یا کهنه باشند، می‌سازد و ذخیره می‌کند."""
+        tables = self.ngram_tables.get(corpus_name)
+        if tables is not None and tables.matches(corpus):
+            return tables
+        path = self._ngram_path(corpus_name)
+        try:
+            # تازگی جدول‌ها فقط از روی سرآیند بررسی می‌شود تا فایل کهنه بی‌جهت mmap نشود
+            fresh = NgramTables(header=read_cache_header(path)[0].get("ngram_tables")).matches(corpus)
+        except (OSError, ValueError):
+            fresh = False
+        if fresh:
+            tables = NgramTables.load(path)
+        else:
+            tables = NgramTables.build(corpus, tmp_dir=self.script_dir, progress=lambda fraction: self.root.after(
+                0, self._update_status, f"در حال ساخت جدول‌های n-gram ({fraction:.0%})..."))
+            tables.save(path)
+        self.ngram_tables[corpus_name] = tables
+        return tables
+
+    def _refresh_facet_choices(self):
+        facets = self.corpus.facets() if self.corpus else []
+        self.facet_combo.config(values=["کل مجموعه"] + facets)
+        if self.facet_var.get() not in facets:
+            self.facet_var.set("کل مجموعه")
+        for combo, var in ((self.compare_a_combo, self.compare_a_var), (self.compare_b_combo, self.compare_b_var)):
+            combo.config(values=["بدون مقایسه"] + facets)
+            if var.get() not in facets:
+                var.set("بدون مقایسه")
+
+    def _corpus_root(self, corpus_name: str | None) -> Path | None:
+        corpus = self.corpora.get(corpus_name) if corpus_name else None
+        return corpus.root_folder_path if corpus is not None else None
+
     def _force_reprocess(self):
         if messagebox.askyesno("تایید پردازش مجدد",
                                "آیا مطمئن هستید؟\nاین کار فایل کش فعلی را حذف کرده و فرآیند زمان‌بر پردازش تمام کتاب‌ها را دوباره آغاز می‌کند."):
             try:
-                if os.path.exists(self.cache_path): os.remove(self.cache_path)
+                self._shutdown_search_pool()
+                self.ngram_tables.pop(self.active_corpus_name, None)
+                for path in (self.cache_path, self.legacy_cache_path, self._ngram_path(self.active_corpus_name)):
+                    if os.path.exists(path): os.remove(path)
                 self.root.title(self.base_title)
                 self._initiate_loading_process()
             except Exception as e:
@@ -660,9 +2898,15 @@ class TextAnalyzerApp:
         try:
             self.root.after(0, self._update_status, "در حال خواندن لیست اصلاحات...")
             correction_dict = load_correction_list(correction_path)
+            if correction_dict is None:
+                raise ValueError(f"فایل لیست اصلاحات خوانده نشد: {correction_path}")
+            normalizer = self._ensure_normalizer()
             self.root_folder_path = root_folder.resolve()
+            self.registry.add(self.active_corpus_name, self.root_folder_path)
 
-            docx_files = list(self.root_folder_path.rglob('*.docx'))
+            # کتاب‌ها به ترتیب مسیر پردازش می‌شوند تا هر زیرپوشه بازه‌ای پیوسته از بخش‌ها باشد
+            docx_files = sorted(self.root_folder_path.rglob('*.docx'),
+                                key=lambda p: book_sort_key(p.relative_to(self.root_folder_path).as_posix()))
             if not docx_files:
                 self.root.after(0, self._enable_ui_after_load, "هیچ فایل .docx یافت نشد.");
                 return
@@ -672,42 +2916,176 @@ class TextAnalyzerApp:
             for i, file_path_obj in enumerate(docx_files):
                 self.root.after(0, self._update_progress, (i / total_files) * 50,
                                 f"پردازش فایل‌ها: {file_path_obj.name}")
-                text_content = get_text_from_docx(file_path_obj)
-                if text_content:
-                    corrected_text = make_corrections_fast(text_content, correction_dict)
-                    processed_segments = process_paragraphs(
-                        corrected_text.split('\n'), self.normalizer, self.MAX_WORDS, self.IDEAL_WORDS
-                    )
-                    relative_file_path = file_path_obj.relative_to(self.root_folder_path)
-                    for segment_text in processed_segments:
-                        all_segments_data.append(
-                            {'book_path': str(relative_file_path.with_suffix('')), 'sentence': segment_text})
-
-            temp_tagged_data, total_segments = [], len(all_segments_data)
-            for i, item in enumerate(all_segments_data):
-                self.root.after(0, self._update_progress, 50 + (i / total_segments) * 50,
-                                f"تحلیل دستوری بخش {i + 1} از {total_segments}...")
-                tokens = word_tokenize(item['sentence']);
-                tagged = self.pos_tagger.tag(tokens)
-                temp_tagged_data.append((item['sentence'], tagged, item['book_path']))
-            self.tagged_data = temp_tagged_data
+                relative_file_path = file_path_obj.relative_to(self.root_folder_path)
+                for segment_text in self._segment_book(file_path_obj, correction_dict, normalizer):
+                    all_segments_data.append(
+                        {'book_path': str(relative_file_path.with_suffix('')), 'sentence': segment_text})
+
+            # بخش‌های تکراری فقط یک بار برچسب می‌خورند؛ نسخه‌های عیناً تکراری به صورت ارجاع ذخیره می‌شوند
+            self.root.after(0, self._update_status, "در حال تشخیص بخش‌های تکراری...")
+            detector = DuplicateDetector()
+            for item in all_segments_data:
+                item['copy_of'], item['near_of'] = detector.check(item['sentence'])
+
+            tag_cache = self._open_tag_cache()
+            total_segments = len(all_segments_data)
+
+            def tagged_segments():
+                for i, item in enumerate(all_segments_data):
+                    self.root.after(0, self._update_progress, 50 + (i / total_segments) * 50,
+                                    f"تحلیل دستوری بخش {i + 1} از {total_segments}...")
+                    if item['copy_of'] >= 0:
+                        yield item['sentence'], (), item['book_path'], item['copy_of'], -1
+                        continue
+                    yield (item['sentence'], tag_cache.tag(item['sentence'], self._tag_text), item['book_path'],
+                           -1, item['near_of'])
+
+            try:
+                self.corpus = Corpus.from_segments(tagged_segments(), self.root_folder_path)
+            finally:
+                tag_cache.close()
+            self.root.after(0, self._update_status, "در حال ساخت نمایه...")
+            self.corpus.ensure_layers(self._lemmatize)
+            self.corpora[self.active_corpus_name] = self.corpus
 
             self.root.after(0, self._update_status, "در حال ذخیره داده‌های پردازش‌شده...")
-            with open(self.cache_path, 'wb') as f:
-                pickle.dump((self.tagged_data, self.root_folder_path), f)
+            save_corpus_cache(self.corpus, self.cache_path,
+                              self._cache_build_info(self.root_folder_path,
+                                                     correction_list_info(correction_path, correction_dict)),
+                              self.CACHE_COMPRESSION)
+            self.root.after(0, self._update_status, "در حال ساخت جدول‌های n-gram...")
+            self._get_ngram_tables(self.active_corpus_name, self.corpus)
             self.root.after(0, self._enable_ui_after_load,
-                            f"پردازش و ذخیره‌سازی با موفقیت انجام شد ({len(self.tagged_data)} ردیف).")
+                            f"پردازش و ذخیره‌سازی با موفقیت انجام شد ({len(self.corpus)} ردیف، "
+                            f"{self.corpus.stats()['duplicates']} تکراری، {tag_cache.hits} بخش از کش برچسب‌گذاری).")
         except Exception as e:
             traceback.print_exc();
             self.root.after(0, self._show_generic_error, f"خطا در پردازش و ذخیره‌سازی: {e}")
 
+    def _segment_book(self, file_path: Path, correction_dict: dict, normalizer) -> list[str]:
+        """متن یک کتاب را خوانده، اصلاح و به بخش‌ها تقسیم می‌کند."""
+        text_content = get_text_from_docx(file_path)
+        if not text_content:
+            return []
+        corrected_text = make_corrections_fast(text_content, correction_dict)
+        return process_paragraphs(corrected_text.split('\n'), normalizer, self.MAX_WORDS, self.IDEAL_WORDS)
+
+    def _choose_correction_list(self):
+        if self.corpus is None or self.corpus.root_folder_path is None:
+            messagebox.showwarning("اعمال لیست اصلاحات", "ابتدا داده‌ها باید پردازش و بارگذاری شوند.")
+            return
+        correction_path_str = filedialog.askopenfilename(title="فایل اکسل 'لیست اصلاحات' جدید را انتخاب کنید",
+                                                         filetypes=(("Excel Files", "*.xlsx *.xlsm"),
+                                                                    ("All files", "*.*")))
+        if not correction_path_str:
+            return
+        self._prepare_for_loading()
+        threading.Thread(target=self._correction_list_worker, args=(Path(correction_path_str),), daemon=True).start()
+
+    def _offer_correction_update(self, correction_path: Path):
+        if not messagebox.askyesno(
+                "لیست اصلاحات تغییر کرده است",
+                f"فایل لیست اصلاحات پس از ساخت کش ویرایش شده است:\n{correction_path}\n\n"
+                "آیا تغییرات روی داده‌ها اعمال و کش بازنویسی شود؟ برای کتاب‌هایی که دیگر در پوشه نیستند، "
+                "مدخل‌های حذف‌شده قابل بازگرداندن نیستند."):
+            return
+        self._prepare_for_loading()
+        threading.Thread(target=self._correction_list_worker, args=(correction_path,), daemon=True).start()
+
+    def _correction_list_worker(self, correction_path: Path):
+        try:
+            header = read_cache_header(self.cache_path)[0]
+            self.root.after(0, self._enable_ui_after_load, self._apply_correction_list(header, correction_path))
+        except Exception as e:
+            traceback.print_exc();
+            self.root.after(0, self._show_generic_error, f"خطا در اعمال لیست اصلاحات: {e}")
+
+    def _apply_correction_list(self, header: dict, correction_path: Path) -> str:
+        """
+        لیست اصلاحات تازه را بدون پردازش کامل روی کش مجموعه فعال اعمال کرده و پیام نتیجه را برمی‌گرداند.
+        بخش‌های حاوی صورت‌های متأثر از روی نمایه پیدا می‌شوند و فقط کتاب‌های آن‌ها دوباره خوانده و
+        اصلاح می‌شوند؛ بخش‌هایی که متنشان عوض نشده برچسب‌های قبلی خود را نگه می‌دارند.
+        """
+        self.root.after(0, self._update_status, "در حال خواندن لیست اصلاحات...")
+        correction_dict = load_correction_list(correction_path)
+        if correction_dict is None:
+            return "فایل لیست اصلاحات خوانده نشد (ممکن است باز یا نیمه‌ذخیره باشد)؛ داده‌ها تغییری نکردند."
+        new_info = correction_list_info(correction_path, correction_dict)
+        old_info = header.get("corrections") or {}
+        corpus = self.corpus
+        changed, forms = diff_correction_lists(old_info.get("entries") or {}, correction_dict)
+        normalizer = self._ensure_normalizer()
+        from hazm import word_tokenize
+        affected = set()
+        for form in forms:
+            affected.update(corpus.segments_with_words(word_tokenize(normalizer.normalize(form))))
+        affected_books = {corpus.seg_books[seg] for seg in affected}
+
+        message = "لیست اصلاحات تغییری در متن بخش‌ها ایجاد نکرد."
+        if affected_books:
+            # کتاب‌های متأثر دوباره بخش‌بندی می‌شوند چون اصلاح می‌تواند مرز بخش‌ها را جابه‌جا کند
+            new_segments, missing_books = [], 0  # (جمله، کتاب، بخش قدیمی با همین متن یا None)
+            for book_id, segs in groupby(range(len(corpus)), key=corpus.seg_books.__getitem__):
+                segs, book_path = list(segs), corpus.books[book_id]
+                if book_id not in affected_books:
+                    new_segments.extend((corpus.sentence(seg), book_path, seg) for seg in segs)
+                    continue
+                self.root.after(0, self._update_status, f"اعمال لیست اصلاحات: {Path(book_path).name}")
+                file_path = corpus.root_folder_path / f"{book_path}.docx"
+                if file_path.exists():
+                    texts = self._segment_book(file_path, correction_dict, normalizer)
+                else:
+                    # بدون متن خام فقط مدخل‌های تازه روی متن ذخیره‌شده اعمال می‌شوند
+                    missing_books += 1
+                    texts = [normalizer.normalize(make_corrections_fast(corpus.sentence(seg), changed)) for seg in segs]
+                old_by_text = {corpus.sentence(seg): seg for seg in segs}
+                new_segments.extend((text, book_path, old_by_text.get(text)) for text in texts)
+
+            detector, retagged, tag_cache = DuplicateDetector(), 0, self._open_tag_cache()
+
+            def segments():
+                nonlocal retagged
+                for text, book_path, old_seg in new_segments:
+                    copy_of, near_of = detector.check(text)
+                    if copy_of >= 0:
+                        yield text, (), book_path, copy_of, -1
+                    elif old_seg is not None:
+                        yield text, corpus.tagged_segment(old_seg), book_path, -1, near_of
+                    else:
+                        retagged += 1
+                        self.root.after(0, self._update_status, f"تحلیل دستوری بخش‌های اصلاح‌شده ({retagged})...")
+                        yield text, tag_cache.tag(text, self._tag_text), book_path, -1, near_of
+
+            try:
+                updated = Corpus.from_segments(segments(), corpus.root_folder_path)
+            finally:
+                tag_cache.close()
+            self.root.after(0, self._update_status, "در حال ساخت نمایه...")
+            updated.ensure_layers(self._lemmatize)
+            self.corpus = self.corpora[self.active_corpus_name] = updated
+            self.ngram_tables.pop(self.active_corpus_name, None)
+            ngram_path = self._ngram_path(self.active_corpus_name)
+            if os.path.exists(ngram_path):
+                os.remove(ngram_path)
+            message = (f"لیست اصلاحات اعمال شد: {len(affected_books)} کتاب بررسی و "
+                       f"{retagged} بخش دوباره برچسب‌گذاری شد.")
+            if missing_books:
+                message += f" ({missing_books} کتاب در پوشه یافت نشد و فقط مدخل‌های تازه روی آن اعمال شد.)"
+        header["corrections"] = new_info
+        self.root.after(0, self._update_status, "در حال ذخیره داده‌های پردازش‌شده...")
+        save_corpus_cache(self.corpus, self.cache_path, header, header.get("compression"))
+        return message
+
     def _enable_ui_after_load(self, message):
+        self.loading = False
         self.progressbar.pack_forget();
         self._update_status(message)
-        if self.tagged_data:
+        if self.corpus:
             self.search_button.config(state=tk.NORMAL)
+        self._rebuild_corpus_menu()
+        self._refresh_facet_choices()
         if hasattr(self, 'root_folder_path') and self.root_folder_path:
-            self.root.title(f"{self.base_title} - {self.root_folder_path.name}")
+            self.root.title(f"{self.base_title} - {self.active_corpus_name} ({self.root_folder_path.name})")
         elif "لغو شد" in message or "یافت نشد" in message:
             self.root.title(self.base_title)
         else:
@@ -733,7 +3111,12 @@ class TextAnalyzerApp:
             self.condition_entry.grid_remove()
 
     def _start_search(self, event=None):
+        # کلید Enter دکمه غیرفعال را دور می‌زند؛ تا پایان بارگذاری یا جستجوی قبلی کاری انجام نمی‌شود
+        if str(self.search_button['state']) == tk.DISABLED or self.corpus is None or self.normalizer is None:
+            return
         phrase = self.keyword_entry.get().strip();
+        if self.search_type_var.get() == "کشف هم‌نشین‌ها":
+            phrase = phrase or "کشف هم‌نشین‌ها"
         if not phrase: messagebox.showwarning("ورودی نامعتبر", "لطفاً عبارت کلیدی را وارد کنید."); return
         self.last_search_phrase = phrase;
 
@@ -743,114 +3126,332 @@ class TextAnalyzerApp:
             if condition_type != "فرقی نمی‌کند" and not condition_value:
                 messagebox.showwarning("ورودی ناقص", f"برای شرط '{condition_type}' باید یک مقدار وارد کنید.");
                 return
-
-        self.search_button.config(state=tk.DISABLED);
-        self.results_tree.delete(*self.results_tree.get_children())
-        self.source_text.config(state=tk.NORMAL);
-        self.source_text.delete(1.0, tk.END);
-        self.source_text.config(state=tk.DISABLED)
-        self.results_count_var.set("");
-        self._update_status(f"در حال جستجو برای عبارت '{phrase}'...")
+        compare = (self.compare_a_var.get(), self.compare_b_var.get())
+        if "بدون مقایسه" in compare or self.search_type_var.get() == "کشف هم‌نشین‌ها":
+            compare = None
+        else:
+            (lo_a, hi_a), (lo_b, hi_b) = (self.corpus.facet_segment_range(facet) for facet in compare)
+            if lo_a < hi_b and lo_b < hi_a:
+                messagebox.showwarning("مقایسه نامعتبر", "دو گروه مقایسه باید پوشه‌ها یا کتاب‌های جدا از هم باشند.")
+                return
 
         params = {
             "search_phrase": phrase,
+            "search_type": self.search_type_var.get(),
             "mode": self.mode_var.get(),
             "condition_type": self.condition_var.get(),
             "condition_value": self.normalizer.normalize(self.condition_entry.get().strip()),
-            "pos_filter": self.pos_var.get()
+            "pos_filter": self.pos_var.get(),
+            "facet": None if self.facet_var.get() == "کل مجموعه" else self.facet_var.get(),
+            "match_layer": "lemma" if self.match_by_var.get() == "بن" else "word",
+            "group_layer": "lemma" if self.group_by_var.get() == "بن" else "word",
+            "ngram_size": int(self.ngram_size_var.get()),
+            "ngram_layer": "wordpos" if self.ngram_layer_var.get() == "صورت+نقش" else "word",
+            "ngram_pos": [pos_var.get() for pos_var in self.ngram_pos_vars[:int(self.ngram_size_var.get())]],
+            "ngram_measure": self.ngram_measure_var.get(),
+            "unique_only": self.count_mode_var.get() == "فقط یکتا",
+            "compare": compare,
+            "keyness_measure": self.keyness_measure_var.get(),
+            "approximate": self.approximate_var.get()
         }
-        threading.Thread(target=self._perform_search, args=(params,), daemon=True).start()
+        self._launch_search(params)
 
-    def _check_filters(self, word, pos, params):
-        pos_filter = params["pos_filter"]
-        if pos_filter != "هر نقشی":
-            required_tags = self.pos_map.get(pos_filter, set())
-            if pos not in required_tags: return False
-        condition_type = params["condition_type"];
-        condition_value = params["condition_value"]
-        if condition_type == "حاوی" and condition_value not in word: return False
-        if condition_type == "شروع با" and not word.startswith(condition_value): return False
-        return True
+    def _launch_search(self, params):
+        self.exact_count_params = None
+        self.exact_count_button.pack_forget()
+        self.search_button.config(state=tk.DISABLED);
+        self.results_tree.delete(*self.results_tree.get_children())
+        self.current_results = []
+        self.source_text.config(state=tk.NORMAL);
+        self.source_text.delete(1.0, tk.END);
+        self.source_text.config(state=tk.DISABLED)
+        self.results_count_var.set("");
+        if params["approximate"]:
+            self._update_status(f"در حال جستجوی تقریبی برای عبارت '{params['search_phrase']}'...")
+        else:
+            self._update_status(f"در حال جستجو برای عبارت '{params['search_phrase']}'...")
+        threading.Thread(target=self._perform_search, args=(params,), daemon=True).start()
 
     def _perform_search(self, params):
-        search_type = self.search_type_var.get()
+        try:
+            self._run_search(params)
+        except CancelledError:
+            pass  # استخر جستجو برای بارگذاری بسته شد؛ پایان بارگذاری دکمه جستجو را دوباره فعال می‌کند
+        except Exception as e:
+            traceback.print_exc();
+            self.root.after(0, self._show_search_error, f"خطا در جستجو: {e}")
+
+    def _show_search_error(self, exc_str):
+        self._update_status("خطا در جستجو.")
+        if not self.loading:
+            self.search_button.config(state=tk.NORMAL)
+        messagebox.showerror("خطای پیش‌بینی نشده", f"خطایی رخ داد:\n\n{exc_str}")
+
+    def _run_search(self, params):
+        search_type = params["search_type"]
         user_search_phrase = params["search_phrase"]
 
         direct_phrase_info_list = []
         collocation_results = []
         self.direct_phrase_sources.clear()
         self.sentence_mapping.clear()
+        self.dispersion.clear()
+        self.lazy_sources.clear()
+        # یک پرسش روی تمام مجموعه‌های انتخاب‌شده اجرا و فراوانی به تفکیک مجموعه نگه‌داری می‌شود.
+        # در حالت مقایسه، دو گروه مجموعه فعال به جای مجموعه‌ها شمرده می‌شوند: (نام، پیکره، بازه بخش‌ها، برچسب)
+        if params["compare"]:
+            scopes = [(self.active_corpus_name, self.corpus, self.corpus.facet_segment_range(facet), facet)
+                      for facet in params["compare"]]
+        else:
+            scopes = [(corpus_name, corpus, corpus.facet_segment_range(params["facet"]), corpus_name)
+                      for corpus_name, corpus in self._search_corpora()]
+        corpus_counts = defaultdict(Counter)
+        fraction, sort_by_frequency = 1.0, True  # سهم نمونه‌گیری‌شده در حالت تقریبی
+
+        def format_corpus_counts(key):
+            if len(scopes) < 2:
+                return ""
+            return " | ".join(f"{name}: {round(count / fraction)}" for name, count in corpus_counts[key].most_common())
+
+        def record(key, corpus_name, corpus, seg, label=None):
+            """یک رخداد را به همراه کتاب آن (برای پراکندگی) و مجموعه یا گروهش ثبت می‌کند."""
+            corpus_counts[key][label or corpus_name] += 1
+            self.dispersion[key][(corpus_name, corpus.book_path(seg))] += 1
 
         if search_type == "عین عبارت کلیدی":
             normalized_user_phrase = self.normalizer.normalize(user_search_phrase)
             if not normalized_user_phrase.strip():
-                self.root.after(0, self._update_ui_with_results, [], []);
+                self.root.after(0, self._update_ui_with_results, [], [])
                 return
 
             substring_match_counter = Counter()
-            for original_sentence, tagged_sentence, book_path_or_name in self.tagged_data:
-                normalized_original_sentence = self.normalizer.normalize(original_sentence)
-                if normalized_user_phrase in normalized_original_sentence:
-                    for word, pos in tagged_sentence:
-                        if normalized_user_phrase in self.normalizer.normalize(word):
-                            substring_match_counter[(word, pos)] += 1
-                            self.direct_phrase_sources[word].append((original_sentence, book_path_or_name))
-                            break
+            for corpus_name, corpus, facet_range, label in scopes:
+                if facet_range is None:
+                    continue
+                for seg in range(*facet_range):
+                    if params["unique_only"] and not corpus.counts_as_unique(seg, *facet_range):
+                        continue
+                    normalized_original_sentence = self.normalizer.normalize(corpus.sentence(seg))
+                    if normalized_user_phrase in normalized_original_sentence:
+                        for k, (word, pos) in enumerate(corpus.tagged_segment(seg)):
+                            if normalized_user_phrase in self.normalizer.normalize(word):
+                                substring_match_counter[(word, pos)] += 1
+                                record(("تطابق جزئی", word), corpus_name, corpus, seg, label)
+                                token = corpus.segment_tokens(seg)[0] + k
+                                self.direct_phrase_sources[word].append((corpus_name, seg, token, token + 1))
+                                break
 
             for (found_word, pos), count in substring_match_counter.most_common():
                 sample_display = f"{found_word} ({user_search_phrase})"
                 friendly_pos = self.reverse_pos_map.get(pos, pos)
-                direct_phrase_info_list.append((sample_display, found_word, friendly_pos, count, "تطابق جزئی"))
+                key = ("تطابق جزئی", found_word)
+                direct_phrase_info_list.append((sample_display, found_word, friendly_pos, count, "تطابق جزئی",
+                                                format_corpus_counts(key), len(self.dispersion[key])))
 
         elif search_type == "کلمات مجاور":
-            search_tokens = word_tokenize(self.normalizer.normalize(user_search_phrase))
-            if not search_tokens:
-                self.root.after(0, self._update_ui_with_results, [], []);
+            from hazm import word_tokenize
+            try:
+                query_parts = parse_query(user_search_phrase, self.normalizer, word_tokenize, self.pos_map)
+            except ValueError as e:
+                self.root.after(0, messagebox.showwarning, "الگوی نامعتبر", str(e))
+                self.root.after(0, self._update_ui_with_results, [], [])
+                return
+            if not query_parts:
+                self.root.after(0, self._update_ui_with_results, [], [])
                 return
 
-            search_phrase_str = " ".join(search_tokens)
-            phrase_len = len(search_tokens)
+            match_layer, group_layer = params["match_layer"], params["group_layer"]
+            is_pattern = not is_literal_query(query_parts)
+            if is_pattern:
+                search_phrase_str = user_search_phrase
+            elif match_layer == "lemma":
+                search_phrase_str = " ".join(self._lemmatize(token, "") for _, token in query_parts)
+            else:
+                search_phrase_str = " ".join(token for _, token in query_parts)
             mode = params["mode"]
-            before_counter, after_counter = Counter(), Counter()
-            exact_match_for_collocation_counter = 0
-            exact_match_sources_for_collocation = []
-            has_filters = params["pos_filter"] != "هر نقشی" or params["condition_type"] != "فرقی نمی‌کند"
-
-            for original_sentence, tagged_sentence, book_path_or_name in self.tagged_data:
-                words = [item[0] for item in tagged_sentence]
-                for i in range(len(words) - phrase_len + 1):
-                    if words[i:i + phrase_len] == search_tokens:
-                        exact_match_for_collocation_counter += 1
-                        exact_match_sources_for_collocation.append((original_sentence, book_path_or_name))
-                        if mode in ["هر دو", "کلمه قبلی"] and i > 0:
-                            prev_word, prev_pos = tagged_sentence[i - 1]
-                            if not has_filters or self._check_filters(prev_word, prev_pos, params):
-                                before_counter[(prev_word, prev_pos, f"{prev_word} {search_phrase_str}")] += 1
-                                self.sentence_mapping[("قبل", prev_word)].append((original_sentence, book_path_or_name))
-                        if mode in ["هر دو", "کلمه بعدی"] and i + phrase_len < len(words):
-                            next_word, next_pos = tagged_sentence[i + phrase_len]
-                            if not has_filters or self._check_filters(next_word, next_pos, params):
-                                after_counter[(next_word, next_pos, f"{search_phrase_str} {next_word}")] += 1
-                                self.sentence_mapping[("بعد", next_word)].append((original_sentence, book_path_or_name))
-
-            if exact_match_for_collocation_counter > 0:
+            direct_key = ("عبارت کلیدی", user_search_phrase)
+            options = {"unique": params["unique_only"], "group_layer": group_layer, "mode": mode,
+                       "is_pattern": is_pattern, "phrase": search_phrase_str, "direct_key": direct_key,
+                       "pos_tags": None if params["pos_filter"] == "هر نقشی" else
+                       frozenset(self.pos_map.get(params["pos_filter"], ())),
+                       "condition_type": params["condition_type"], "condition_value": params["condition_value"]}
+
+            # هر واحد جستجو: (نام مجموعه، پیکره، پرسش کامپایل‌شده، محدوده، بازه بخش‌های واحد، برچسب). در حالت
+            # تقریبی محدوده‌ها به بلوک‌هایی تقسیم می‌شوند که به ترتیب تصادفی و تا زمان توقف نمونه‌گیر پردازش می‌شوند
+            units = []
+            for corpus_name, corpus, facet_range, label in scopes:
+                if "lemma" in (match_layer, group_layer) and not corpus.has_lemmas():
+                    continue
+                compiled = compile_query(query_parts, corpus, match_layer, self._lemmatize)
+                if compiled is None or facet_range is None:
+                    continue
+                blocks = [facet_range]
+                if params["approximate"]:
+                    blocks = [(lo, min(lo + APPROX_BLOCK_SEGMENTS, facet_range[1]))
+                              for lo in range(*facet_range, APPROX_BLOCK_SEGMENTS)]
+                units.extend((corpus_name, corpus, compiled, facet_range, block, label) for block in blocks)
+
+            tally, sampler = CollocationTally(), None
+            if params["approximate"]:
+                def ranking():
+                    top = heapq.nlargest(APPROX_TOP_K, chain(tally.before.items(), tally.after.items(),
+                                                             tally.pattern.items()), key=lambda item: item[1])
+                    return [key for key, _ in top], tally.hits
+
+                sampler = SearchSampler(units, lambda unit: unit[4][1] - unit[4][0], ranking)
+                for corpus_name, corpus, compiled, facet_range, block, label in sampler:
+                    tally_collocations(tally, corpus_name, corpus, compiled, facet_range, block, label, options)
+            else:
+                heavy = SEARCH_WORKERS > 1 and \
+                    any(query_anchor_postings(unit[1], unit[2]) >= PARALLEL_MIN_POSTINGS for unit in units)
+                if heavy:
+                    # پرسش‌های پرکار بین پردازه‌ها تقسیم می‌شوند؛ مجموعه‌هایی که کش mmap‌پذیر ندارند همین‌جا شمرده می‌شوند
+                    jobs = [(corpus_name, corpus, self._shareable_cache_path(corpus_name), compiled, facet_range,
+                             block, label) for corpus_name, corpus, compiled, facet_range, block, label in units]
+                    try:
+                        tally = parallel_tally(self._get_search_pool(), SEARCH_WORKERS, jobs, options)
+                    except BrokenProcessPool:
+                        traceback.print_exc()  # ادامه با اجرای ترتیبی
+                        self._shutdown_search_pool()
+                        heavy = False
+                    else:
+                        # کارگرها فقط شمارش‌ها را برمی‌گردانند؛ رخدادهای هر ردیف هنگام انتخاب آن پیدا می‌شوند
+                        resolver = CollocationRefs(units, options)
+                        for key in tally.key_counts:
+                            self.lazy_sources[key] = partial(resolver, key)
+                if not heavy:
+                    for corpus_name, corpus, compiled, facet_range, block, label in units:
+                        tally_collocations(tally, corpus_name, corpus, compiled, facet_range, block, label, options)
+            for target, source in ((corpus_counts, tally.key_counts), (self.dispersion, tally.dispersion)):
+                for key, counts in source.items():
+                    target[key].update(counts)
+            for key, refs in tally.refs.items():
+                self.sentence_mapping[key].extend(refs)
+            before_counter, after_counter, pattern_counter = tally.before, tally.after, tally.pattern
+
+            fraction = sampler.fraction if sampler is not None else 1.0
+
+            def estimated(sample, count):
+                """در حالت تقریبی (نمونه همراه با بازه اطمینان ۹۵٪، فراوانی تخمینی) را برمی‌گرداند."""
+                estimate, low, high = estimate_count(count, fraction)
+                return (f"{sample} (≈ {low}–{high})" if fraction < 1 else sample), estimate
+
+            for matched_text, count in pattern_counter.most_common():
+                sample, count = estimated(matched_text, count)
+                collocation_results.append((sample, matched_text, "-", count, "الگو",
+                                            format_corpus_counts(("الگو", matched_text)),
+                                            len(self.dispersion[("الگو", matched_text)])))
+
+            if tally.hits > 0:
+                sample, count = estimated(user_search_phrase, tally.hits)
                 direct_phrase_info_list.append(
-                    (user_search_phrase, user_search_phrase, "-", exact_match_for_collocation_counter, "عبارت کلیدی"))
-                self.direct_phrase_sources[user_search_phrase] = exact_match_sources_for_collocation
+                    (sample, user_search_phrase, "-", count, "عبارت کلیدی",
+                     format_corpus_counts(direct_key), len(self.dispersion[direct_key])))
+                self.direct_phrase_sources[user_search_phrase] = tally.hit_refs
 
             if mode in ["هر دو", "کلمه قبلی"]:
                 for (word, pos, sample), count in before_counter.most_common():
                     friendly_pos = self.reverse_pos_map.get(pos, pos)
-                    collocation_results.append((sample, word, friendly_pos, count, "قبل"))
+                    sample, count = estimated(sample, count)
+                    collocation_results.append((sample, word, friendly_pos, count, "قبل",
+                                                format_corpus_counts(("قبل", word)),
+                                                len(self.dispersion[("قبل", word)])))
             if mode in ["هر دو", "کلمه بعدی"]:
                 for (word, pos, sample), count in after_counter.most_common():
                     friendly_pos = self.reverse_pos_map.get(pos, pos)
-                    collocation_results.append((sample, word, friendly_pos, count, "بعد"))
+                    sample, count = estimated(sample, count)
+                    collocation_results.append((sample, word, friendly_pos, count, "بعد",
+                                                format_corpus_counts(("بعد", word)),
+                                                len(self.dispersion[("بعد", word)])))
+
+            if params["compare"] and collocation_results:
+                self._rank_by_keyness(collocation_results, corpus_counts, direct_key, params)
+                sort_by_frequency = False
+
+        elif search_type == "کشف هم‌نشین‌ها":
+            self._perform_discovery(params, collocation_results)
+            status = None
+            if not params["unique_only"] and len(self.corpus.copy_segs):
+                status = ("فراوانی‌های «کشف» از جدول‌های n-gram هستند و نسخه‌های عیناً تکراری را "
+                          "(حتی در حالت «همه رخدادها») فقط یک بار می‌شمارند.")
+            self.root.after(0, self._update_ui_with_results, direct_phrase_info_list, collocation_results, False,
+                            status)
+            return
+
+        self.root.after(0, self._update_ui_with_results, direct_phrase_info_list, collocation_results,
+                        sort_by_frequency)
+        if fraction < 1:
+            self.root.after(0, self._offer_exact_count, params, fraction)
 
-        self.root.after(0, self._update_ui_with_results, direct_phrase_info_list, collocation_results)
+    def _offer_exact_count(self, params, fraction):
+        """پس از نتیجه تقریبی، دکمه «شمارش دقیق» را برای اجرای کامل همان جستجو در پس‌زمینه نشان می‌دهد."""
+        self.exact_count_params = dict(params, approximate=False)
+        self.exact_count_button.pack(side=tk.RIGHT, padx=(0, 5), pady=2)
+        self._update_status(f"نتایج تقریبی از نمونه {fraction:.1%} بخش‌ها؛ کنار هر نمونه بازه اطمینان ۹۵٪ "
+                            f"فراوانی آمده است.")
 
-    def _update_ui_with_results(self, direct_phrase_info_list, collocation_results):
+    def _run_exact_count(self):
+        if str(self.search_button['state']) == tk.DISABLED or self.corpus is None: return
+        if self.exact_count_params is not None:
+            self._launch_search(self.exact_count_params)
+
+    def _rank_by_keyness(self, collocation_results, corpus_counts, direct_key, params):
+        """
+        ردیف‌های هم‌نشین را بر اساس log-likelihood (معناداری تفاوت دو گروه) مرتب کرده و معیار انتخاب‌شده را
+        کنار هر نمونه می‌نویسد. اندازه هر گروه تعداد رخدادهای کلیدواژه در آن است، پس مقایسه روی نسبت
+        همراهی هر کلمه با کلیدواژه انجام می‌شود و نه بسامد خام آن.
+        """
+        group_a, group_b = params["compare"]
+        counts = [corpus_counts[(row[4], row[1])] for row in collocation_results]
+        log_likelihood, pct_diff = keyness_scores([count[group_a] for count in counts],
+                                                  [count[group_b] for count in counts],
+                                                  corpus_counts[direct_key][group_a], corpus_counts[direct_key][group_b])
+        scores = log_likelihood if params["keyness_measure"] == "log-likelihood" else pct_diff
+        ranked = []
+        for row_index in log_likelihood.argsort(kind='stable')[::-1].tolist():
+            sample, *rest = collocation_results[row_index]
+            score = scores[row_index]
+            direction = "" if pct_diff[row_index] == 0 else \
+                f"، بیشتر در {group_a if pct_diff[row_index] > 0 else group_b}"
+            ranked.append((f"{sample} ({params['keyness_measure']}: {score:.2f}{direction})", *rest))
+        collocation_results[:] = ranked
+
+    def _perform_discovery(self, params, collocation_results):
+        """
+        قوی‌ترین ترکیب‌های دوتایی/سه‌تایی کل مجموعه فعال را از جدول‌های n-gram می‌خواند. جملات منبع و
+        پراکندگی هر ترکیب فقط هنگام انتخاب ردیف (یا خروجی گرفتن) از نمایه پیدا می‌شوند.
+        """
+        corpus_name, corpus = self.active_corpus_name, self.corpus
+        self.root.after(0, self._update_status, "در حال خواندن جدول‌های n-gram...")
+        tables = self._get_ngram_tables(corpus_name, corpus)
+        n = params["ngram_size"]
+        tag_sets = []
+        for pos_name in params["ngram_pos"]:
+            if pos_name == "هر نقشی":
+                tag_sets.append(None)
+                continue
+            tag_ids = {corpus.tag_ids[tag] for tag in self.pos_map[pos_name] if tag in corpus.tag_ids}
+            if not tag_ids:
+                return
+            tag_sets.append(tag_ids)
+        layer = "wordpos" if any(tags is not None for tags in tag_sets) else params["ngram_layer"]
+        measure = params["ngram_measure"]
+
+        for word_ids, tag_ids, count, score in tables.top(corpus, n, layer, tag_sets, measure):
+            ngram_text = " ".join(corpus.words[word_id] for word_id in word_ids)
+            key = ("کشف", ngram_text if tag_ids is None else
+                   f"{ngram_text} [{' '.join(corpus.tags[tag_id] for tag_id in tag_ids)}]")
+            self.lazy_sources[key] = partial(self._ngram_sources, corpus_name,
+                                             [('slot', 'word', frozenset({word_id})) for word_id in word_ids], tag_ids)
+            friendly_pos = " ".join(self.reverse_pos_map.get(corpus.tags[tag_id], corpus.tags[tag_id])
+                                    for tag_id in tag_ids) if tag_ids is not None else "-"
+            sample = ngram_text if measure == "فراوانی" else f"{ngram_text} ({measure}: {score:.2f})"
+            collocation_results.append((sample, key[1], friendly_pos, count, "کشف", "", ""))
+
+    def _update_ui_with_results(self, direct_phrase_info_list, collocation_results, sort_by_frequency=True,
+                                status=None):
         self.results_tree.delete(*self.results_tree.get_children())
+        self.current_results = direct_phrase_info_list + collocation_results
         total_results_count = 0
 
         if direct_phrase_info_list:
@@ -865,21 +3466,23 @@ class TextAnalyzerApp:
             total_results_count += len(collocation_results)
 
         if total_results_count == 0:
-            self.results_tree.insert("", "end", values=("", "هیچ نتیجه‌ای یافت نشد.", "", "", ""))
+            self.results_tree.insert("", "end", values=("", "هیچ نتیجه‌ای یافت نشد.", "", "", "", "", ""))
             self.results_count_var.set("نتایج: 0")
         else:
             self.results_count_var.set(f"نتایج: {total_results_count}")
-            self.root.after(100, lambda: self._sort_treeview('فراوانی', True))
+            if sort_by_frequency:
+                self.root.after(100, lambda: self._sort_treeview('فراوانی', True))
 
-        self._update_status("پردازش کامل شد. آماده برای جستجوی بعدی.")
-        self.search_button.config(state=tk.NORMAL)
+        self._update_status(status or "پردازش کامل شد. آماده برای جستجوی بعدی.")
+        if not self.loading:
+            self.search_button.config(state=tk.NORMAL)
 
     def _sort_treeview(self, col, reverse):
         try:
             data = [(self.results_tree.set(item, col), item) for item in self.results_tree.get_children('') if
                     self.results_tree.set(item, 'کلمه') != "هیچ نتیجه‌ای یافت نشد."]
 
-            if col == "فراوانی":
+            if col in ("فراوانی", "پراکندگی"):
                 data.sort(key=lambda t: int(t[0]) if str(t[0]).isdigit() else 0, reverse=reverse)
             else:
                 data.sort(key=lambda t: str(t[0]), reverse=reverse)
@@ -890,6 +3493,11 @@ class TextAnalyzerApp:
 
 
 if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == "--benchmark":
+        # python Collocation_Search.py --benchmark <مسیر کش> <پرسش> [1,2,4,8]
+        counts = tuple(int(n) for n in sys.argv[4].split(",")) if len(sys.argv) > 4 else (1, 2, 4, 8)
+        benchmark_parallel_search(sys.argv[2], sys.argv[3], counts)
+        sys.exit()
     try:
         from ctypes import windll;
 